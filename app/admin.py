@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import UserProfile, Message, User
+from .models import UserProfile, Message, User, Conversation, Task
 
 admin.site.register(Message)
 admin.site.register(UserProfile)
-admin.site.register(User)
\ No newline at end of file
+admin.site.register(User)
+admin.site.register(Conversation)
+admin.site.register(Task)
\ No newline at end of file
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import search  # noqa: F401  (rejestruje sygnały indeksu wyszukiwania)
+        from . import fragments  # noqa: F401  (unieważnianie fragmentów profili)
+        from . import database  # noqa: F401  (PRAGMY SQLite)
+        from . import authentication  # noqa: F401  (unieważnianie użytkownika w cache)
+        from . import fonts  # noqa: F401  (sprawdzenie, czy czcionki są zbudowane)
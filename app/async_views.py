@@ -0,0 +1,168 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+
+from . import fragments
+from .forms import MessageForm
+from .matching import acached_ranking, ranking_depth
+from .models import UserProfile, Message, User, Conversation
+from .notifications import get_broker, format_event
+from .pagination import akeyset_page
+from .routers import replica_reads
+from .search import search_page
+from .unread import get_unread_count
+from .views import _filter_profiles, _liked_user_ids, _profile_list_context, _render_profile_cards, \
+    _render_profile_details
+
+
+# Odpowiedniki widoków z views.py dla serwera ASGI (włączane ustawieniem
+# ASYNC_VIEWS, patrz zapisani_sobie/asgi.py). Zapytania idą przez asynchroniczne
+# ORM; renderowanie szablonów (context processory sięgają do bazy i cache)
+# i zapisy w transakcjach - przez sync_to_async.
+
+arender = sync_to_async(render)
+
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user jest leniwy i przy pierwszym użyciu odpytuje bazę synchronicznie
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+################### PROFILE #####################################################
+
+@async_login_required
+@replica_reads
+async def profile_list(request):
+    profiles = await UserProfile.objects.aget(user_id=request.user.pk)
+    filtered_profiles = _filter_profiles(request, profiles)
+
+    page_number = request.GET.get('page')
+    ranking = await acached_ranking(profiles, filtered_profiles, ranking_depth(page_number, 24))
+    page = Paginator(ranking, 24).get_page(page_number)
+    user_ids = {pk: user_id async for pk, user_id in
+                UserProfile.objects.filter(pk__in=page.object_list).values_list('pk', 'user_id')}
+    cards = await sync_to_async(fragments.cached_fragments)('profile_card', list(user_ids.values()),
+                                                            _render_profile_cards)
+    liked = {user_id async for user_id in _liked_user_ids(request.user, user_ids.values())}
+
+    return await arender(request, 'profile_list.html', _profile_list_context(request, page, user_ids, cards, liked))
+
+
+@async_login_required
+@replica_reads
+async def user_profile(request, user_id):
+    details = await sync_to_async(fragments.cached_fragments)('profile_detail', [user_id], _render_profile_details)
+    if user_id not in details:
+        raise Http404
+
+    liked = await _liked_user_ids(request.user, [user_id]).aexists()
+    return await arender(request, 'user_profile.html', {'detail': details[user_id], 'profile_user_id': user_id,
+                                                        'liked': liked})
+
+
+############################ WIADOMOŚĆI #####################################################################
+
+@async_login_required
+@replica_reads
+async def inbox(request):
+    sorting_options = request.GET.get('sorting', 'received')
+    search_query = request.GET.get('q')
+
+    messages = Message.objects.mailbox(request.user, sorting_options)
+
+    if search_query:
+        page = await sync_to_async(search_page)(messages, search_query, request.GET.get('page'))
+    else:
+        page = await akeyset_page(messages, older=request.GET.get('older'), newer=request.GET.get('newer'))
+
+    context = {
+        'messages': page,
+        'sorting_option': sorting_options,
+        'search_query': search_query,
+    }
+
+    return await arender(request, 'inbox.html', context)
+
+
+@async_login_required
+async def view_message(request, message_id):
+    try:
+        message = await Message.objects.select_related('sender').aget(id=message_id, receiver=request.user)
+    except Message.DoesNotExist:
+        raise Http404
+    await sync_to_async(message.mark_read)()
+    return await arender(request, 'view_message.html', {'message': message})
+
+
+@async_login_required
+async def send_message(request, receiver_id):
+    try:
+        receiver = await User.objects.aget(id=receiver_id)
+    except User.DoesNotExist:
+        raise Http404
+
+    if request.method == 'POST':
+        form = MessageForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            message = form.save(commit=False)
+            message.sender = request.user
+            message.receiver = receiver
+            await sync_to_async(message.save)()
+            return redirect('app:inbox')
+    else:
+        form = MessageForm()
+    conversation = await Conversation.objects.between(request.user, receiver).afirst()
+    return await arender(request, 'send_message.html', {'form': form, 'receiver': receiver,
+                                                        'conversation': conversation})
+
+
+############################ POWIADOMIENIA #####################################################################
+
+# Django 4.2 nie przerywa strumienia po rozłączeniu klienta, więc połączenie ma
+# ograniczony czas życia; przeglądarka (EventSource) sama łączy się ponownie.
+EVENT_STREAM_LIFETIME = 5 * 60
+KEEPALIVE_INTERVAL = 15
+
+
+@async_login_required
+async def letter_events(request):
+    """Strumień Server-Sent Events z nowymi listami zalogowanego użytkownika."""
+    if not settings.ASYNC_VIEWS:
+        # pod WSGI połączenie zajmowałoby wątek przez cały czas; 204 wyłącza EventSource
+        return HttpResponse(status=204)
+
+    unread_count = await sync_to_async(get_unread_count)(request.user)
+    response = StreamingHttpResponse(_letter_stream(request.user.pk, unread_count),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _letter_stream(user_id, unread_count):
+    broker = get_broker()
+    queue = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENT_STREAM_LIFETIME
+    try:
+        yield 'retry: 5000\n' + format_event('unread', {'unread': unread_count})
+        while loop.time() < deadline:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield format_event('letter', event)
+    finally:
+        broker.unsubscribe(user_id, queue)
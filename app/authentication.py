@@ -0,0 +1,36 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User
+
+
+# Zalogowany użytkownik trzymany w cache - AuthenticationMiddleware nie czyta
+# wiersza User przy każdym żądaniu. Zapis lub usunięcie użytkownika (zmiana
+# hasła, dezaktywacja konta) usuwa wpis, więc sprawdzenie hasha sesji
+# i is_active działa na aktualnych danych.
+
+CACHE_TIMEOUT = 60 * 5
+
+
+def cache_key(user_id):
+    return 'auth-user:%s' % user_id
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = cache.get(cache_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(cache_key(user_id), user, CACHE_TIMEOUT)
+        return user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: cache.delete(cache_key(user_id)))
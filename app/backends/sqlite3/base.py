@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, w którym transakcje (atomic) zaczynają się od BEGIN IMMEDIATE.
+
+    Przy zwykłym BEGIN transakcja, która najpierw czyta, a potem pisze (np.
+    zapis listu z aktualizacją rozmowy), nie czeka na blokadę (busy_timeout),
+    tylko od razu kończy się błędem "database is locked", jeśli w międzyczasie
+    pisał ktoś inny. IMMEDIATE bierze blokadę zapisu na starcie i czeka w kolejce.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+# Wspólne dla poleceń mierzących czas (benchmark_*, loadtest, tune_password_hasher).
+# W pomiarach wielowątkowych wątki zbierają czasy u siebie i łączą je raz, na
+# końcu - pomiar nie czeka na wspólną blokadę.
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, len(sorted_values) * percent // 100)]
+
+
+def time_calls(repeat, function):
+    """Wywołuje `function` `repeat` razy; zwraca posortowane czasy w ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+class Timings:
+    """Czasy udanych operacji (ms) i liczba błędów, osobno dla każdej operacji."""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+
+    def add(self, operation, milliseconds):
+        self.latencies[operation].append(milliseconds)
+
+    def error(self, operation):
+        self.errors[operation] += 1
+
+    def merge(self, other):
+        for operation, latencies in other.latencies.items():
+            self.latencies[operation].extend(latencies)
+        self.errors.update(other.errors)
+
+    def count(self, operation):
+        return len(self.latencies[operation])
+
+    def percentile(self, operation, percent):
+        latencies = self.latencies[operation]
+        latencies.sort()
+        return percentile(latencies, percent)
+
+
+def run_threads(count, duration, target):
+    """Uruchamia `count` wątków `target(number, deadline, timings)` na `duration`
+    sekund i zwraca ich połączone Timings."""
+    deadline = time.monotonic() + duration
+    total = Timings()
+    lock = threading.Lock()
+
+    def run(number):
+        own = Timings()
+        try:
+            target(number, deadline, own)
+        finally:
+            with lock:
+                total.merge(own)
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return total
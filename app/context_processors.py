@@ -0,0 +1,14 @@
+from django.conf import settings
+
+from .unread import get_unread_count
+
+
+def unread_letters(request):
+    if not request.user.is_authenticated:
+        return {}
+    return {'unread_letters': get_unread_count(request.user)}
+
+
+def letter_events(request):
+    # kanał SSE trzyma połączenie otwarte - pod WSGI zająłby worker na stałe
+    return {'letter_events': settings.ASYNC_VIEWS}
@@ -0,0 +1,80 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from django.contrib.staticfiles import finders
+from django.core.checks import Tags, Warning, register
+
+
+# Czcionki serwowane z app/static/fonts jako WOFF2 okrojone do znaków łacińskich
+# i polskich (`python manage.py build_fonts`). Każda strona ładuje tylko te,
+# których używa - patrz tag {% font_faces %}.
+
+Font = namedtuple('Font', 'family google_family weights fallback')
+Font.__new__.__defaults__ = ((400,), 'cursive')
+
+# klucz: nazwa używana w CSS; dla czcionek listów to wartość Message.font_family
+FONTS = {
+    'Lato': Font('Lato', 'Lato', (400, 700), 'sans-serif'),
+    'MonteCarlo': Font('MonteCarlo', 'MonteCarlo'),
+    'Alex Brush': Font('Alex Brush', 'Alex Brush'),
+    'Dancing Script': Font('Dancing Script', 'Dancing Script'),
+    'Ephesis': Font('Ephesis', 'Ephesis'),
+    'Great Vibes': Font('Great Vibes', 'Great Vibes'),
+    'Monte Carlo': Font('Monte Carlo', 'MonteCarlo'),
+    'Parisienne': Font('Parisienne', 'Parisienne'),
+    'Petit Formal Script': Font('Petit Formal Script', 'Petit Formal Script'),
+}
+
+# ikony (<span class="material-icons">nazwa</span>) - @font-face i klasa są w style.css;
+# plik zawiera tylko ligatury z ICONS, więc nowa ikona w szablonie wymaga dopisania
+# jej tutaj i ponownego `build_fonts`
+ICON_FONT = Font('Material Icons', 'Material Icons', (400,), 'monospace')
+ICONS = ('add_photo_alternate', 'cake', 'delete', 'edit', 'favorite', 'favorite_border', 'forum', 'interests',
+         'language', 'logout', 'mail', 'menu', 'person', 'public', 'school', 'search', 'settings', 'transgender',
+         'translate', 'trending_down', 'trending_up', 'work')
+
+# czcionki szablonu bazowego (treść strony i nawigacja)
+PAGE_FONTS = ('Lato', 'MonteCarlo')
+LETTER_FONTS = ('Alex Brush', 'Dancing Script', 'Ephesis', 'Great Vibes', 'Monte Carlo', 'Parisienne',
+                'Petit Formal Script')
+
+SUBSET_TEXT = ''.join(chr(code) for code in range(0x20, 0x7f)) + \
+    'ąćęłńóśźżĄĆĘŁŃÓŚŹŻ„”“’–—…«»·'
+
+
+def font_file(font, weight):
+    return 'fonts/%s-%d.woff2' % (re.sub(r'\W+', '-', font.google_family.lower()), weight)
+
+
+@lru_cache(maxsize=None)
+def is_built(path):
+    return finders.find(path) is not None
+
+
+def google_css_url(fonts, text=None):
+    query = [('family', '%s:wght@%s' % (font.google_family, ';'.join(map(str, font.weights))))
+             for font in fonts]
+    query.append(('display', 'swap'))
+    if text:
+        query.append(('text', text))
+    return 'https://fonts.googleapis.com/css2?' + urlencode(query)
+
+
+def required_files():
+    fonts = list(FONTS.values()) + [ICON_FONT]
+    return sorted({font_file(font, weight) for font in fonts for weight in font.weights})
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_fonts(app_configs=None, **kwargs):
+    # bez pliku {% font_faces %} pobiera czcionkę z fonts.googleapis.com (bez blokowania
+    # renderowania, ale z dodatkowym połączeniem), a ikony się nie wyświetlą
+    missing = [path for path in required_files() if finders.find(path) is None]
+    if not missing:
+        return []
+    return [Warning('Brak czcionek w app/static: %s.' % ', '.join(missing),
+                    hint='Uruchom `python manage.py build_fonts` (bez dostępu do Google Fonts: '
+                         '`--source` z plikami TTF/WOFF2) i dodaj pliki do repozytorium.',
+                    id='app.W001')]
@@ -86,28 +86,7 @@ class UserProfileForm(forms.ModelForm):
         widget=forms.CheckboxSelectMultiple(),
         label='Zainteresowania',
         required=False,
-        choices=[
-            ('movies_series', 'Filmy/seriale'),
-            ('music', 'Muzyka'),
-            ('singing', 'Śpiewanie'),
-            ('dancing', 'Taniec'),
-            ('books', 'Książki'),
-            ('poetics', 'Poezja'),
-            ('photography', 'Fotografia'),
-            ('painting_drawing', 'Malowanie/rysowanie'),
-            ('art', 'Sztuka'),
-            ('theater', 'Teatr'),
-            ('learning_languages', 'Nauka języków'),
-            ('cooking_baking', 'Gotowanie/pieczenie'),
-            ('traveling', 'Podróżowanie'),
-            ('swimming', 'Pływanie'),
-            ('cycling', 'Jazda na rowerze'),
-            ('skiing_snowboarding', 'Narty/snowboard'),
-            ('football', 'Piłka nożna'),
-            ('basketball', 'Koszykówka'),
-            ('volleyball', 'Siatkówka'),
-            ('tennis', 'Tenis'),
-            ('other_sport', 'Inny sport')])
+        choices=UserProfile.INTEREST_CHOICES)
 
     languages = forms.CharField(
         max_length=200,
@@ -141,6 +120,13 @@ class UserProfileForm(forms.ModelForm):
 
     profile_pic = forms.ImageField(widget=forms.FileInput())
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial['interests'] = self.instance.interest_keys()
+
+    def clean_interests(self):
+        return UserProfile.interests_to_mask(self.cleaned_data['interests'])
+
     class Meta:
             model = UserProfile
             fields = ['bio', 'country', 'interests', 'languages', 'education', 'job', 'sex_preference', 'min_age_preference', 'max_age_preference', 'profile_pic']
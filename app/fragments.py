@@ -0,0 +1,110 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.safestring import mark_safe
+
+from .models import User, UserProfile
+from .routers import primary
+
+
+# Wyrenderowane fragmenty profili (karta na liście, szczegóły) trzymane w cache
+# pod kluczem z id użytkownika i wersją jego profilu. Zapis User/UserProfile
+# usuwa wersję - następny odczyt nadaje nową, więc stare fragmenty nie są już
+# nigdy trafiane i po prostu wygasają.
+
+CACHE_TIMEOUT = 60 * 60 * 24
+FRAGMENTS = ('profile_card', 'profile_detail', 'own_profile')
+STATS_KEY = 'fragment-stats:%s:%s'
+
+# pola Usera, których zmiana nie wpływa na wygląd profilu
+UNRENDERED_USER_FIELDS = {'last_login', 'password'}
+
+
+def version_key(user_id):
+    return 'profile-version:%d' % user_id
+
+
+def fragment_key(name, user_id, version):
+    return 'profile-fragment:%s:%d:%d' % (name, user_id, version)
+
+
+def get_versions(user_ids):
+    versions = {}
+    found = cache.get_many([version_key(user_id) for user_id in user_ids])
+    new = {}
+    for user_id in user_ids:
+        versions[user_id] = found.get(version_key(user_id))
+        if versions[user_id] is None:
+            versions[user_id] = new[version_key(user_id)] = time.time_ns()
+    if new:
+        cache.set_many(new, None)
+    return versions
+
+
+def invalidate(*user_ids):
+    transaction.on_commit(lambda: cache.delete_many([version_key(user_id) for user_id in user_ids]))
+
+
+def cached_fragments(name, user_ids, render):
+    """{user_id: html} dla fragmentu `name`; `render(brakujące_id)` zwraca
+    {user_id: html} dla tych, których nie ma w cache."""
+    versions = get_versions(user_ids)
+    keys = {fragment_key(name, user_id, versions[user_id]): user_id for user_id in user_ids}
+    fragments = {keys[key]: mark_safe(html) for key, html in cache.get_many(keys).items()}
+    missing = [user_id for user_id in user_ids if user_id not in fragments]
+    _record(name, hits=len(fragments), misses=len(missing))
+
+    if missing:
+        # fragment trafia do cache na długo - dane z bazy głównej, nie z repliki
+        with primary():
+            rendered = render(missing)
+        cache.set_many({fragment_key(name, user_id, versions[user_id]): str(html)
+                        for user_id, html in rendered.items()}, CACHE_TIMEOUT)
+        fragments.update(rendered)
+    return fragments
+
+
+################## STATYSTYKI #####################################################
+
+def _record(name, hits, misses):
+    for kind, count in (('hits', hits), ('misses', misses)):
+        if count:
+            key = STATS_KEY % (name, kind)
+            if not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    pass
+
+
+def get_stats(names=FRAGMENTS):
+    keys = [STATS_KEY % (name, kind) for name in names for kind in ('hits', 'misses')]
+    found = cache.get_many(keys)
+    return {name: (found.get(STATS_KEY % (name, 'hits'), 0), found.get(STATS_KEY % (name, 'misses'), 0))
+            for name in names}
+
+
+def reset_stats(names=FRAGMENTS):
+    cache.delete_many([STATS_KEY % (name, kind) for name in names for kind in ('hits', 'misses')])
+
+
+################## UNIEWAŻNIANIE #####################################################
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= UNRENDERED_USER_FIELDS:
+        return
+    invalidate(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate(instance.pk)
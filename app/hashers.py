@@ -0,0 +1,48 @@
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import ScryptPasswordHasher
+
+
+# scrypt z hashlib (bez dodatkowych pakietów) - oprócz czasu procesora wymaga
+# 128 * block_size * work_factor bajtów pamięci, co utrudnia łamanie na GPU.
+# Koszt z settings.PASSWORD_SCRYPT; dobiera go `python manage.py tune_password_hasher`.
+# Hasła zapisane ze starymi parametrami (albo PBKDF2) są przeliczane przy
+# najbliższym udanym logowaniu - robi to ModelBackend przez must_update().
+
+DEFAULT_COST = {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1}
+
+
+def scrypt_memory(work_factor, block_size, parallelism):
+    # bufory B i V algorytmu scrypt (+ 1 MB zapasu) - limit maxmem dla OpenSSL
+    return 128 * block_size * (work_factor + parallelism + 2) + 1024 * 1024
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    def _cost(self, name):
+        return getattr(settings, 'PASSWORD_SCRYPT', {}).get(name, DEFAULT_COST[name])
+
+    @property
+    def work_factor(self):
+        return self._cost('work_factor')
+
+    @property
+    def block_size(self):
+        return self._cost('block_size')
+
+    @property
+    def parallelism(self):
+        return self._cost('parallelism')
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        # jak w ScryptPasswordHasher, ale maxmem wynika z parametrów - domyślny
+        # limit OpenSSL (32 MB) nie wystarcza już od work_factor = 2**15
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                               maxmem=scrypt_memory(n, r, p), dklen=64)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
@@ -0,0 +1,87 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+# Stałe warianty zdjęć profilowych zapisywane obok oryginału, np.
+# profile_pics/3f/3fa4...e1.jpg -> profile_pics/3f/3fa4...e1.thumb.webp
+# Rozmiary odpowiadają ramkom w szablonach (230x400 px na liście, 2x na profilu).
+RENDITIONS = {
+    'thumb': (230, 400),
+    'medium': (460, 800),
+}
+RENDITION_FORMAT = 'WEBP'
+RENDITION_EXTENSION = 'webp'
+RENDITION_QUALITY = 80
+ORIENTATION = 0x0112  # znacznik EXIF
+
+
+def rendition_name(name, rendition):
+    root, ext = os.path.splitext(name)
+    return '%s.%s.%s' % (root, rendition, RENDITION_EXTENSION)
+
+
+def rendition_names(name):
+    return [rendition_name(name, rendition) for rendition in RENDITIONS]
+
+
+def _replace(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def without_metadata(image, image_format):
+    """Zawartość pliku bez EXIF. Zdjęcie jest najpierw obracane według znacznika
+    Orientation - bez niego zdjęcia z telefonu wyświetlałyby się obrócone."""
+    buffer = BytesIO()
+    options = {'icc_profile': image.info['icc_profile']} if 'icc_profile' in image.info else {}
+    if image.getexif().get(ORIENTATION, 1) != 1:
+        ImageOps.exif_transpose(image).save(buffer, format=image_format, **options)
+    elif image_format == 'JPEG':
+        image.save(buffer, format=image_format, quality='keep', **options)
+    else:
+        image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(content):
+    """Plik zdjęcia bez EXIF (np. położenia GPS z telefonu) - wołane przed
+    wyznaczeniem nazwy z zawartości. Pliki bez EXIF zwracane są bez zmian."""
+    content.seek(0)
+    try:
+        image = Image.open(content)
+        image.load()
+    except (OSError, Image.DecompressionBombError):
+        content.seek(0)
+        return content  # nie-obrazek odrzuca walidacja formularza
+    content.seek(0)
+    if 'exif' not in image.info:
+        return content
+    return ContentFile(without_metadata(image, image.format), name=content.name)
+
+
+def generate_renditions(name, storage=default_storage):
+    """Dekoduje oryginał raz i zapisuje wszystkie warianty."""
+    with storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+
+    # oryginał jest już bez EXIF (ProfilePictureStorage); obrót dla starszych plików
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    for rendition, size in RENDITIONS.items():
+        buffer = BytesIO()
+        ImageOps.fit(image, size, Image.LANCZOS).save(buffer, format=RENDITION_FORMAT,
+                                                      quality=RENDITION_QUALITY, method=6)
+        _replace(storage, rendition_name(name, rendition), buffer.getvalue())
+
+
+def delete_with_renditions(name, storage=default_storage):
+    for file_name in [name] + rendition_names(name):
+        storage.delete(file_name)
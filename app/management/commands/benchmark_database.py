@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.db import OperationalError, connection, connections
+from django.core.management.base import BaseCommand
+
+from app.benchmarks import run_threads
+from app.models import Message, User
+
+
+OPERATIONS = ('send', 'read', 'inbox')
+
+
+class Command(BaseCommand):
+    help = ('Mierzy przepustowość bazy przy równoległych użytkownikach: wysyłanie listów, oznaczanie '
+            'jako przeczytane i odczyt skrzynki. Tworzy tymczasowych użytkowników bench-*, usuwa ich na końcu.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--weights', default='4,3,3', help='Proporcje operacji send,read,inbox.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        weights = [int(weight) for weight in options['weights'].split(',')]
+        self.stdout.write('baza: %s %s' % (connection.vendor, self.describe(connection)))
+
+        users = [User.objects.create(username='bench-%d' % i, email='bench-%d@benchmark.invalid' % i)
+                 for i in range(options['users'])]
+        user_ids = [user.pk for user in users]
+
+        def worker(number, deadline, timings):
+            rng = random.Random(options['seed'] + number)
+            try:
+                while time.monotonic() < deadline:
+                    operation = rng.choices(OPERATIONS, weights)[0]
+                    sender_id, receiver_id = rng.sample(user_ids, 2)
+                    start = time.perf_counter()
+                    try:
+                        run_operation(operation, sender_id, receiver_id)
+                    except OperationalError:  # np. "database is locked"
+                        timings.error(operation)
+                        continue
+                    timings.add(operation, (time.perf_counter() - start) * 1000)
+            finally:
+                connections.close_all()
+
+        timings = run_threads(options['threads'], options['duration'], worker)
+
+        try:
+            self.report(timings, options['duration'])
+        finally:
+            Message.objects.filter(sender_id__in=user_ids).batch_delete()
+            User.objects.filter(pk__in=user_ids).delete()
+
+    def describe(self, db):
+        if db.vendor != 'sqlite':
+            return '(CONN_MAX_AGE=%s)' % db.settings_dict.get('CONN_MAX_AGE')
+        with db.cursor() as cursor:
+            settings = []
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute('PRAGMA %s' % pragma)
+                settings.append('%s=%s' % (pragma, cursor.fetchone()[0]))
+        return '(%s)' % ', '.join(settings)
+
+    def report(self, timings, duration):
+        self.stdout.write('%-6s %9s %7s %9s %8s %8s' % ('', 'operacje', 'błędy', 'na sek.', 'p50 ms', 'p95 ms'))
+        total = 0
+        for name in OPERATIONS:
+            total += timings.count(name)
+            self.stdout.write('%-6s %9d %7d %9.1f %8.1f %8.1f' % (
+                name, timings.count(name), timings.errors[name], timings.count(name) / duration,
+                timings.percentile(name, 50), timings.percentile(name, 95)))
+        self.stdout.write('razem: %.1f operacji/s, błędów: %d' % (total / duration, sum(timings.errors.values())))
+
+
+def run_operation(operation, sender_id, receiver_id):
+    if operation == 'send':
+        Message.objects.create(sender_id=sender_id, receiver_id=receiver_id,
+                               subject='Benchmark', body='Treść listu testowego.')
+    elif operation == 'read':
+        message = Message.objects.filter(receiver_id=receiver_id, is_read=False).order_by('-id').first()
+        if message is not None:
+            message.mark_read()
+    else:
+        list(Message.objects.mailbox(User(pk=receiver_id), 'received')[:20])
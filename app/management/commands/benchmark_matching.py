@@ -0,0 +1,65 @@
+import random
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.benchmarks import percentile, time_calls
+from app.matching import RANKING_CACHE_SIZE, cached_ranking, rank_profiles, ranking_key
+from app.models import User, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Mierzy czas rankingu dopasowań (rank_profiles razem z odczytem z bazy) na syntetycznych profilach.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=100000)
+        parser.add_argument('--budget-ms', type=float, default=200.0)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # profile powstają w transakcji, która jest na końcu wycofywana
+        with transaction.atomic():
+            viewer = self.create_profiles(options['profiles'], random.Random(options['seed']))
+            candidates = UserProfile.objects.exclude(user_id=viewer.user_id)
+
+            # to, co płaci pierwsza strona bez rankingu w cache
+            timings = time_calls(options['repeat'], lambda: rank_profiles(viewer, candidates, RANKING_CACHE_SIZE))
+            cache.delete(ranking_key(viewer, candidates))
+            cached_ranking(viewer, candidates, 24)
+            page_timings = time_calls(options['repeat'], lambda: cached_ranking(viewer, candidates, 264)[240:264])
+            cache.delete(ranking_key(viewer, candidates))
+            transaction.set_rollback(True)
+
+        median = percentile(timings, 50)
+        self.stdout.write('profile: %d, ranking bez cache: najlepszy czas %.1f ms, mediana %.1f ms' % (
+            options['profiles'], timings[0], median))
+        self.stdout.write('kolejna strona z rankingu w cache: mediana %.1f ms' % percentile(page_timings, 50))
+        if median > options['budget_ms']:
+            self.stdout.write(self.style.WARNING('Przekroczono budżet %.0f ms.' % options['budget_ms']))
+        else:
+            self.stdout.write(self.style.SUCCESS('Mieści się w budżecie %.0f ms.' % options['budget_ms']))
+
+    def create_profiles(self, count, rng):
+        full_mask = sum(UserProfile.INTEREST_BITS.values())
+        prefix = 'benchmark-%d-' % rng.randint(0, 10 ** 9)
+        users = User.objects.bulk_create(
+            [User(username='%s%d' % (prefix, number), email='%s%d@example.com' % (prefix, number))
+             for number in range(count + 1)], batch_size=5000)
+        profiles = []
+        for user in users:
+            min_age = rng.choice([None, rng.randint(18, 40)])
+            profiles.append(UserProfile(
+                user=user,
+                sex=rng.choice('WMO'),
+                age=rng.randint(18, 80),
+                sex_preference=rng.choice(['', 'W', 'M', 'O', 'A']),
+                min_age_preference=min_age,
+                max_age_preference=min_age and min_age + rng.randint(0, 30),
+                interests=rng.randint(0, full_mask),
+            ))
+        UserProfile.objects.bulk_create(profiles, batch_size=5000)
+        viewer = profiles[0]
+        viewer.sex, viewer.age = 'W', 30
+        return viewer
@@ -0,0 +1,138 @@
+import io
+import os
+import re
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.fonts import FONTS, ICON_FONT, ICONS, SUBSET_TEXT, font_file, google_css_url
+
+try:
+    from fontTools.subset import Options, Subsetter
+    from fontTools.ttLib import TTFont
+    from fontTools.varLib import instancer
+except ImportError:
+    TTFont = None
+
+# Google Fonts zwraca WOFF2 tylko przeglądarkom, które go obsługują
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+             'Chrome/120.0 Safari/537.36'
+FONT_URL_RE = re.compile(r"font-weight:\s*(\d+);.*?src:\s*url\((\S+?)\)\s*format\('woff2'\)", re.DOTALL)
+ICON_CSS_URL = 'https://fonts.googleapis.com/icon?family=Material+Icons'
+ICON_URL_RE = re.compile(r"src:\s*url\((\S+?)\)\s*format\('woff2'\)")
+FONT_EXTENSIONS = ('.ttf', '.otf', '.woff', '.woff2')
+
+
+def fetch(url):
+    with urlopen(Request(url, headers={'User-Agent': USER_AGENT}), timeout=30) as response:
+        return response.read()
+
+
+def subset(content, weight, text='', ligatures=()):
+    """WOFF2 z samymi znakami `text` (albo z samymi ligaturami `ligatures` - ikony);
+    czcionka zmienna jest wcześniej ustalana na grubość `weight`."""
+    font = TTFont(io.BytesIO(content))
+    if 'fvar' in font:
+        font = instancer.instantiateVariableFont(
+            font, {axis.axisTag: weight if axis.axisTag == 'wght' else None for axis in font['fvar'].axes})
+    if ligatures:
+        keep_ligatures(font, set(ligatures))
+        text = ''.join(sorted(set(''.join(ligatures))))
+    options = Options()
+    options.flavor = 'woff2'
+    options.hinting = False  # jak w plikach z Google Fonts - przeglądarki i tak pomijają hinting
+    subsetter = Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font.save(output)
+    return output.getvalue()
+
+
+def keep_ligatures(font, names):
+    # bez tego zostałyby wszystkie ikony, których nazwy składają się z tych samych liter
+    characters = {glyph: chr(code) for code, glyph in font.getBestCmap().items()}
+    for lookup in font['GSUB'].table.LookupList.Lookup:
+        for table in lookup.SubTable:
+            table = getattr(table, 'ExtSubTable', table)
+            if getattr(table, 'LookupType', None) != 4:
+                continue
+            table.ligatures = {
+                first: kept for first, kept in (
+                    (first, [ligature for ligature in ligatures
+                             if ''.join(characters.get(glyph, '') for glyph in [first] + ligature.Component) in names])
+                    for first, ligatures in table.ligatures.items())
+                if kept}
+
+
+def find_sources(directory):
+    """{(rodzina, grubość): zawartość pliku}; grubość None - czcionka zmienna."""
+    sources = {}
+    for root, dirs, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            if not name.lower().endswith(FONT_EXTENSIONS):
+                continue
+            with open(os.path.join(root, name), 'rb') as file:
+                content = file.read()
+            font = TTFont(io.BytesIO(content), lazy=True)
+            if font['head'].macStyle & 2:  # kursywa
+                continue
+            family = font['name'].getDebugName(16) or font['name'].getDebugName(1)
+            weight = None if 'fvar' in font else font['OS/2'].usWeightClass
+            sources.setdefault((family, weight), content)
+    return sources
+
+
+class Command(BaseCommand):
+    help = ('Zapisuje w app/static/fonts czcionki jako WOFF2 okrojone do znaków polskich oraz ikony Material Icons '
+            'okrojone do app.fonts.ICONS. Domyślnie pobiera je z Google Fonts; z --source buduje je z plików '
+            'TTF/WOFF2 w podanym katalogu. Ikony i --source wymagają pakietów fonttools i brotli.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=os.path.join(settings.BASE_DIR, 'app', 'static'))
+        parser.add_argument('--source', help='Katalog z plikami czcionek (np. rozpakowane pakiety Google Fonts).')
+
+    def handle(self, *args, **options):
+        if TTFont is None:
+            raise CommandError('Brak pakietu fonttools (pip install fonttools brotli).')
+        sources = find_sources(options['source']) if options['source'] else None
+
+        missing = []
+        # "Monte Carlo" i "MonteCarlo" to ten sam plik
+        for font in {font.google_family: font for font in FONTS.values()}.values():
+            if sources is None:
+                css = fetch(google_css_url([font], text=SUBSET_TEXT)).decode()
+                files = {int(weight): url for weight, url in FONT_URL_RE.findall(css)}
+                if set(font.weights) - set(files):
+                    raise CommandError('%s: brak wag %s w odpowiedzi Google Fonts' % (
+                        font.google_family, sorted(set(font.weights) - set(files))))
+            for weight in font.weights:
+                if sources is None:
+                    content = fetch(files[weight])
+                else:
+                    source = sources.get((font.google_family, weight)) or sources.get((font.google_family, None))
+                    if source is None:
+                        missing.append('%s %d' % (font.google_family, weight))
+                        continue
+                    content = subset(source, weight, text=SUBSET_TEXT)
+                self.save(options['output'], font_file(font, weight), content)
+
+        if sources is None:
+            source = fetch(ICON_URL_RE.search(fetch(ICON_CSS_URL).decode()).group(1))
+        else:
+            source = sources.get((ICON_FONT.google_family, 400))
+        if source is None:
+            missing.append(ICON_FONT.google_family)
+        else:
+            self.save(options['output'], font_file(ICON_FONT, 400), subset(source, 400, ligatures=ICONS))
+
+        if missing:
+            self.stdout.write(self.style.WARNING('Brak plików źródłowych: %s.' % ', '.join(missing)))
+
+    def save(self, output, name, content):
+        path = os.path.join(output, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        self.stdout.write('%s (%d KB)' % (name, len(content) // 1024))
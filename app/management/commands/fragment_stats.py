@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.fragments import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Pokazuje trafienia i chybienia cache fragmentów profili.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zeruje liczniki po wyświetleniu.')
+
+    def handle(self, *args, **options):
+        for name, (hits, misses) in get_stats().items():
+            total = hits + misses
+            ratio = 100.0 * hits / total if total else 0.0
+            self.stdout.write('%-15s trafienia: %8d  chybienia: %8d  (%.1f%%)' % (name, hits, misses, ratio))
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.images import generate_renditions
+from app.models import UserProfile
+from app.storage import profile_pic_storage
+
+
+class Command(BaseCommand):
+    help = 'Generuje warianty (miniatury) istniejących zdjęć profilowych.'
+
+    def handle(self, *args, **options):
+        names = UserProfile.objects.exclude(profile_pic='').values_list('profile_pic', flat=True).distinct()
+        for name in names.iterator():
+            try:
+                generate_renditions(name, profile_pic_storage)
+            except (OSError, ValueError) as error:
+                self.stderr.write('%s: %s' % (name, error))
+            else:
+                self.stdout.write(name)
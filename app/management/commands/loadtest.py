@@ -0,0 +1,88 @@
+import http.client
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from app.benchmarks import run_threads
+from app.models import User
+
+
+class Command(BaseCommand):
+    help = ('Mierzy przepustowość działających serwerów przy stałej liczbie równoległych klientów, np.\n'
+            '  gunicorn zapisani_sobie.wsgi -w 4 -b :8000 & uvicorn zapisani_sobie.asgi:application --workers 4 --port 8001 &\n'
+            '  manage.py loadtest wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001 --user ala@example.com')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='nazwa=adres, np. asgi=http://127.0.0.1:8001')
+        parser.add_argument('--user', help='E-mail użytkownika, w którego imieniu wysyłane są żądania.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Ścieżka do odpytywania (można podać kilka); domyślnie skrzynka i lista profili.')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=20.0, help='Czas pomiaru w sekundach.')
+        parser.add_argument('--warmup', type=float, default=3.0)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, separator, url = target.partition('=')
+            if not separator:
+                raise CommandError('Cel w formacie nazwa=adres: %s' % target)
+            targets.append((name, urlsplit(url)))
+
+        paths = options['paths'] or [reverse('app:inbox'), reverse('app:profile_list')]
+        headers = {}
+        if options['user']:
+            headers['Cookie'] = '%s=%s' % (settings.SESSION_COOKIE_NAME, self.session_for(options['user']))
+
+        self.stdout.write('%-8s %9s %7s %9s %8s %8s %8s' % ('cel', 'żądania', 'błędy', 'żądań/s', 'p50 ms', 'p95 ms',
+                                                            'p99 ms'))
+        for name, url in targets:
+            run_load(url, paths, headers, options['concurrency'], options['warmup'])
+            timings = run_load(url, paths, headers, options['concurrency'], options['duration'])
+            self.stdout.write('%-8s %9d %7d %9.1f %8.1f %8.1f %8.1f' % (
+                name, timings.count('get'), timings.errors['get'], timings.count('get') / options['duration'],
+                timings.percentile('get', 50), timings.percentile('get', 95), timings.percentile('get', 99)))
+
+    def session_for(self, email):
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError('Nie ma użytkownika %s.' % email)
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+def run_load(url, paths, headers, concurrency, duration):
+    """Każdy z `concurrency` wątków wysyła żądania jedno po drugim (keep-alive)
+    przez `duration` sekund. Zwraca Timings z czasami udanych odpowiedzi (operacja 'get')."""
+    prefix = url.path.rstrip('/')
+
+    def client(number, deadline, timings):
+        connection = None
+        request_number = 0
+        while time.monotonic() < deadline:
+            path = prefix + paths[request_number % len(paths)]
+            request_number += 1
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                start = time.perf_counter()
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                elapsed = (time.perf_counter() - start) * 1000
+            except (OSError, http.client.HTTPException):
+                timings.error('get')
+                connection = None
+                continue
+            if response.status >= 400:
+                timings.error('get')
+            else:
+                timings.add('get', elapsed)
+
+    return run_threads(concurrency, duration, client)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import tasks
+
+
+class Command(BaseCommand):
+    help = 'Wykonuje zadania z kolejki (miniatury, usuwanie starych zdjęć, sprzątanie plików).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Działa jako worker i czeka na nowe zadania.')
+        parser.add_argument('--interval', type=float, default=2.0)
+        parser.add_argument('--sweep', action='store_true',
+                            help='Dodaje do kolejki sprzątanie nieużywanych plików w profile_pics.')
+
+    def handle(self, *args, **options):
+        if options['sweep']:
+            tasks.enqueue('sweep_profile_pictures')
+
+        while True:
+            tasks.requeue_stale()
+            done = tasks.run_pending()
+            if done:
+                self.stdout.write('Wykonano zadań: %d' % done)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
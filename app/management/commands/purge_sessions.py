@@ -0,0 +1,34 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Usuwa wygasłe sesje partiami (uruchamiać regularnie, np. raz dziennie z crona).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not issubclass(store, DatabaseSessionStore):
+            # sesje w ciasteczku lub w cache wygasają same
+            store.clear_expired()
+            self.stdout.write('Silnik %s nie przechowuje sesji w bazie.' % settings.SESSION_ENGINE)
+            return
+
+        # krótkie transakcje zamiast jednego DELETE na całej tabeli - nie blokuje logowań
+        model = store.get_model_class()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(model.objects.filter(expire_date__lt=now)
+                        .values_list('pk', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += model.objects.filter(pk__in=keys).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS('Usunięto wygasłe sesje: %d.' % deleted))
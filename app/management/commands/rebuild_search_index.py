@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Przebudowuje indeks wyszukiwania listów.'
+
+    def handle(self, *args, **options):
+        get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS('Indeks wyszukiwania został przebudowany.'))
@@ -0,0 +1,47 @@
+import calendar
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q, Value
+from django.db.models.functions import ExtractYear
+
+from app import fragments
+from app.models import UserProfile, calculate_age
+
+
+class Command(BaseCommand):
+    help = 'Aktualizuje wiek użytkowników, którzy mają dziś urodziny (uruchamiać raz dziennie, np. z crona).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Przelicza wiek wszystkich użytkowników.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        today = date.today()
+
+        if options['all']:
+            updated = 0
+            batch = []
+            for profile in UserProfile.objects.exclude(date_of_birth=None).only('id', 'user_id', 'date_of_birth', 'age').iterator():
+                age = calculate_age(profile.date_of_birth, today)
+                if profile.age != age:
+                    profile.age = age
+                    batch.append(profile)
+                if len(batch) >= options['batch_size']:
+                    updated += UserProfile.objects.bulk_update(batch, ['age'])
+                    fragments.invalidate(*[profile.user_id for profile in batch])
+                    batch = []
+            updated += UserProfile.objects.bulk_update(batch, ['age'])
+            fragments.invalidate(*[profile.user_id for profile in batch])
+        else:
+            birthdays = Q(date_of_birth__month=today.month, date_of_birth__day=today.day)
+            if (today.month, today.day) == (3, 1) and not calendar.isleap(today.year):
+                birthdays |= Q(date_of_birth__month=2, date_of_birth__day=29)
+            profiles = UserProfile.objects.filter(birthdays)
+            user_ids = list(profiles.values_list('user_id', flat=True))
+            updated = profiles.update(age=Value(today.year) - ExtractYear('date_of_birth'))
+            # po zapisie - fragment wyrenderowany pomiędzy trafiłby do cache ze starym wiekiem
+            fragments.invalidate(*user_ids)
+
+        self.stdout.write(self.style.SUCCESS('Zaktualizowano wiek %d profili.' % updated))
+
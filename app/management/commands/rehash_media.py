@@ -0,0 +1,53 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from app import fragments, tasks
+from app.images import rendition_names
+from app.models import UserProfile, DEFAULT_PROFILE_PIC
+from app.storage import profile_pic_storage
+
+
+class Command(BaseCommand):
+    help = 'Przenosi istniejące zdjęcia profilowe do magazynu adresowanego zawartością (profile_pics/xx/<sha256>) ' \
+           'i poprawia pliki, których zawartość nie zgadza się z adresem.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = profile_pic_storage
+        names = UserProfile.objects.exclude(profile_pic__in=['', DEFAULT_PROFILE_PIC]) \
+            .values_list('profile_pic', flat=True).distinct()
+
+        for old_name in list(names):
+            if not storage.exists(old_name):
+                self.stderr.write('Brak pliku: %s' % old_name)
+                continue
+
+            # także pliki z adresem, których zawartość nie pasuje już do nazwy (oryginały
+            # oczyszczane z EXIF po zapisie) albo które nadal mają EXIF
+            upload_name = os.path.join('profile_pics', 'upload' + os.path.splitext(old_name)[1])
+            with storage.open(old_name) as content:
+                content = storage.prepare(upload_name, content)
+                new_name = storage.content_name(upload_name, content)
+                if new_name == old_name:
+                    continue
+                if not options['dry_run']:
+                    new_name = storage.save(upload_name, content)
+            self.stdout.write('%s -> %s' % (old_name, new_name))
+            if options['dry_run']:
+                continue
+
+            moved = UserProfile.objects.filter(profile_pic=old_name)
+            fragments.invalidate(*moved.values_list('user_id', flat=True))
+            moved.update(profile_pic=new_name)
+            for file_name in [old_name] + rendition_names(old_name):
+                storage.delete(file_name)
+            tasks.enqueue('generate_profile_renditions', name=new_name)
+
+        # puste katalogi po starym układzie profile_pics/<login>/
+        if not options['dry_run']:
+            for directory, subdirectories, files in os.walk(storage.path('profile_pics'), topdown=False):
+                if directory != storage.path('profile_pics') and not os.listdir(directory):
+                    os.rmdir(directory)
@@ -0,0 +1,34 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from app.routers import REPLICA, has_replica
+
+
+class Command(BaseCommand):
+    help = ('Kopiuje bazę SQLite "default" do pliku repliki (DATABASE_REPLICA) - do lokalnych testów '
+            'kierowania odczytów. Z --interval działa w pętli, symulując opóźnioną replikację.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Co ile sekund powtarzać kopiowanie.')
+
+    def handle(self, *args, **options):
+        if not has_replica():
+            raise CommandError('Brak bazy "%s" - ustaw DATABASE_REPLICA.' % REPLICA)
+        source = connections['default']
+        if source.vendor != 'sqlite':
+            raise CommandError('Tylko dla SQLite; replikę Postgresa utrzymuje replikacja strumieniowa.')
+
+        while True:
+            source.ensure_connection()
+            target = sqlite3.connect(connections[REPLICA].settings_dict['NAME'])
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write('Skopiowano bazę do repliki.')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
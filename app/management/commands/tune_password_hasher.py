@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.benchmarks import percentile, time_calls
+from app.hashers import TunedScryptPasswordHasher, scrypt_memory
+
+
+class Command(BaseCommand):
+    help = 'Dobiera koszt scrypt (work_factor) tak, by jedno logowanie mieściło się w zadanym czasie na tym sprzęcie.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100.0)
+        parser.add_argument('--block-size', type=int, default=8)
+        parser.add_argument('--parallelism', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--max-memory-mb', type=int, default=256)
+
+    def handle(self, *args, **options):
+        hasher = TunedScryptPasswordHasher()
+        block_size, parallelism = options['block_size'], options['parallelism']
+
+        chosen = None
+        work_factor = 2 ** 10
+        while scrypt_memory(work_factor, block_size, parallelism) <= options['max_memory_mb'] * 1024 * 1024:
+            median = percentile(time_calls(options['repeat'], lambda: hasher.encode(
+                'haslo-testowe', hasher.salt(), work_factor, block_size, parallelism)), 50)
+            self.stdout.write('work_factor 2**%d: %.1f ms, %.0f MB' % (
+                work_factor.bit_length() - 1, median, scrypt_memory(work_factor, block_size, parallelism) / 2 ** 20))
+            if median > options['target_ms']:
+                break
+            chosen = (work_factor, median)
+            work_factor *= 2
+
+        if chosen is None:
+            self.stdout.write(self.style.WARNING('Nawet 2**10 przekracza %.0f ms.' % options['target_ms']))
+            return
+
+        work_factor, median = chosen
+        current = getattr(settings, 'PASSWORD_SCRYPT', {})
+        self.stdout.write(self.style.SUCCESS(
+            'Wybrano work_factor 2**%d: %.1f ms na logowanie, ok. %.0f logowań/s na rdzeń.' % (
+                work_factor.bit_length() - 1, median, 1000 / median)))
+        self.stdout.write('SCRYPT_WORK_FACTOR=%d SCRYPT_BLOCK_SIZE=%d SCRYPT_PARALLELISM=%d' % (
+            work_factor, block_size, parallelism))
+        if current and current.get('work_factor') != work_factor:
+            self.stdout.write('Obecnie: %s - hasła zostaną przeliczone przy kolejnych logowaniach.' % current)
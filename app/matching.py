@@ -0,0 +1,143 @@
+import hashlib
+import heapq
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+
+from django.core.cache import cache
+
+
+################## RANKING #####################################################
+
+INTEREST_WEIGHT = 10
+AGE_WEIGHT = 1
+
+Viewer = namedtuple('Viewer', 'sex age mask')
+
+# (id, age, interests - maska bitowa); wzajemność preferencji sprawdza już zapytanie
+CANDIDATE_FIELDS = ('id', 'age', 'interests')
+
+
+def score_rows(viewer, rows, limit=None):
+    """Zwraca pary (score, id) dla krotek w formacie CANDIDATE_FIELDS, od najlepszej;
+    `limit` - tylko tyle najlepszych.
+
+    Punkty: wspólne zainteresowania minus różnica wieku.
+    """
+    age, mask = viewer.age, viewer.mask
+
+    def scored():
+        for pk, cand_age, cand_mask in rows:
+            score = bin(cand_mask & mask).count('1') * INTEREST_WEIGHT
+            if age is not None and cand_age is not None:
+                score -= abs(cand_age - age) * AGE_WEIGHT
+            yield score, -pk
+
+    best = heapq.nlargest(limit, scored()) if limit else sorted(scored(), reverse=True)
+    return [(score, -negative_pk) for score, negative_pk in best]
+
+
+def _candidates(viewer, queryset):
+    # odpadają kandydaci, których własne preferencje nie obejmują oglądającego
+    return queryset.accepting(viewer.sex, viewer.age).values_list(*CANDIDATE_FIELDS)
+
+
+def _viewer(viewer_profile):
+    return Viewer(viewer_profile.sex, viewer_profile.age, viewer_profile.interests)
+
+
+def rank_profiles(viewer_profile, queryset, limit=None):
+    """(id profili od najlepszego dopasowania - z `limit` tylko tyle pierwszych, liczba wszystkich pasujących)."""
+    viewer = _viewer(viewer_profile)
+    rows = list(_candidates(viewer, queryset))
+    return [pk for score, pk in score_rows(viewer, rows, limit)], len(rows)
+
+
+async def arank_profiles(viewer_profile, queryset, limit=None):
+    viewer = _viewer(viewer_profile)
+    rows = [row async for row in _candidates(viewer, queryset)]
+    return [pk for score, pk in score_rows(viewer, rows, limit)], len(rows)
+
+
+################## RANKING W CACHE #####################################################
+
+# Na oglądającego i zestaw filtrów w cache trafia tylko początek rankingu
+# (RANKING_CACHE_SIZE id) i liczba wszystkich pasujących profili - pierwsze strony
+# nie przeglądają ponownie kandydatów. Dalsze strony liczą ranking do swojej
+# głębokości bez cache. Nowe profile pojawiają się w nim najpóźniej po RANKING_CACHE_TIMEOUT.
+
+RANKING_CACHE_TIMEOUT = 5 * 60
+RANKING_CACHE_SIZE = 1000
+
+
+class Ranking(Sequence):
+    """Pierwsze id rankingu (co najmniej do oglądanej strony); długość to liczba
+    wszystkich pasujących profili - tyle stron pokaże Paginator."""
+    def __init__(self, ids, total):
+        self.ids = ids
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        return self.ids[index]
+
+
+def ranking_depth(page_number, per_page):
+    """Ile pierwszych id potrzeba do strony `page_number` (jak Paginator.get_page: błędny numer - strona 1)."""
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        number = 1
+    return max(number, 1) * per_page
+
+
+def ranking_key(viewer_profile, queryset):
+    sql, params = queryset.query.sql_with_params()
+    viewer = (viewer_profile.user_id, viewer_profile.sex, viewer_profile.age, viewer_profile.interests)
+    return 'profile-ranking:%s' % hashlib.md5(repr((viewer, sql, params)).encode()).hexdigest()
+
+
+def _pack(ids):
+    return array('q', ids[:RANKING_CACHE_SIZE]).tobytes()
+
+
+def _unpack(packed):
+    ids = array('q')
+    ids.frombytes(packed)
+    return ids
+
+
+def _from_cache(cached, depth):
+    if cached is None:
+        return None
+    total, packed = cached
+    ids = _unpack(packed)
+    if depth > len(ids) and len(ids) < total:
+        return None
+    return Ranking(ids, total)
+
+
+def cached_ranking(viewer_profile, queryset, depth):
+    key = ranking_key(viewer_profile, queryset)
+    cached = cache.get(key)
+    ranking = _from_cache(cached, depth)
+    if ranking is None:
+        ids, total = rank_profiles(viewer_profile, queryset, max(depth, RANKING_CACHE_SIZE))
+        if cached is None:
+            cache.set(key, (total, _pack(ids)), RANKING_CACHE_TIMEOUT)
+        ranking = Ranking(ids, total)
+    return ranking
+
+
+async def acached_ranking(viewer_profile, queryset, depth):
+    key = ranking_key(viewer_profile, queryset)
+    cached = await cache.aget(key)
+    ranking = _from_cache(cached, depth)
+    if ranking is None:
+        ids, total = await arank_profiles(viewer_profile, queryset, max(depth, RANKING_CACHE_SIZE))
+        if cached is None:
+            await cache.aset(key, (total, _pack(ids)), RANKING_CACHE_TIMEOUT)
+        ranking = Ranking(ids, total)
+    return ranking
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_alter_message_font_family_alter_message_font_size_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', '-sent_date'], name='message_receiver_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', '-sent_date'], name='message_sender_sent_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE app_message_search USING fts5("
+        "subject, body, people, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO app_message_search (rowid, subject, body, people) "
+        "SELECT m.id, replace(replace(m.subject, 'ł', 'l'), 'Ł', 'L'), "
+        "replace(replace(m.body, 'ł', 'l'), 'Ł', 'L'), "
+        "replace(replace(r.first_name || ' ' || r.username || ' ' || s.first_name || ' ' || s.username, "
+        "'ł', 'l'), 'Ł', 'L') "
+        "FROM app_message m "
+        "JOIN app_user r ON r.id = m.receiver_id "
+        "JOIN app_user s ON s.id = m.sender_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS app_message_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_message_mailbox_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
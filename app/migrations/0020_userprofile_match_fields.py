@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:45
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_match_fields(apps, schema_editor):
+    User = apps.get_model('app', 'User')
+    UserProfile = apps.get_model('app', 'UserProfile')
+    owner = User.objects.filter(pk=OuterRef('user_id'))
+    UserProfile.objects.update(
+        sex=Subquery(owner.values('sex')[:1]),
+        date_of_birth=Subquery(owner.values('date_of_birth')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='date_of_birth',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='sex',
+            field=models.CharField(blank=True, choices=[('W', 'Kobieta'), ('M', 'Mężczyzna'), ('O', 'Inne')], editable=False, max_length=1),
+        ),
+        migrations.RunPython(copy_match_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['sex', 'date_of_birth'], name='profile_match_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['date_of_birth'], name='profile_birth_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+import re
+
+from django.db import migrations, models
+
+
+INTEREST_KEYS = [
+    'movies_series', 'music', 'singing', 'dancing', 'books', 'poetics', 'photography',
+    'painting_drawing', 'art', 'theater', 'learning_languages', 'cooking_baking', 'traveling',
+    'swimming', 'cycling', 'skiing_snowboarding', 'football', 'basketball', 'volleyball',
+    'tennis', 'other_sport',
+]
+
+
+def interests_to_flags(apps, schema_editor):
+    UserProfile = apps.get_model('app', 'UserProfile')
+    bits = {key: 1 << index for index, key in enumerate(INTEREST_KEYS)}
+    for profile in UserProfile.objects.exclude(interests='').only('id', 'interests'):
+        keys = set(re.findall(r'\w+', profile.interests))
+        flags = sum(bits[key] for key in keys if key in bits)
+        UserProfile.objects.filter(pk=profile.pk).update(interest_flags=flags)
+
+
+def flags_to_interests(apps, schema_editor):
+    UserProfile = apps.get_model('app', 'UserProfile')
+    for profile in UserProfile.objects.exclude(interest_flags=0).only('id', 'interest_flags'):
+        keys = [key for index, key in enumerate(INTEREST_KEYS) if profile.interest_flags & (1 << index)]
+        UserProfile.objects.filter(pk=profile.pk).update(interests=str(keys))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_userprofile_match_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='interest_flags',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(interests_to_flags, flags_to_interests),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='interests',
+        ),
+        migrations.RenameField(
+            model_name='userprofile',
+            old_name='interest_flags',
+            new_name='interests',
+        ),
+    ]
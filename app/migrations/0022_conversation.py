@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Q
+from django.utils.text import Truncator
+import django.db.models.deletion
+
+
+def create_conversations(apps, schema_editor):
+    Message = apps.get_model('app', 'Message')
+    Conversation = apps.get_model('app', 'Conversation')
+
+    pairs = {tuple(sorted(pair)) for pair in Message.objects.values_list('sender_id', 'receiver_id').distinct()}
+    for user_a, user_b in pairs:
+        messages = Message.objects.filter(Q(sender_id=user_a, receiver_id=user_b) |
+                                          Q(sender_id=user_b, receiver_id=user_a))
+        last_message_at = messages.aggregate(last=Max('sent_date'))['last']
+        last_message = messages.filter(sent_date=last_message_at).order_by('-id').first()
+        conversation = Conversation.objects.create(
+            user_a_id=user_a,
+            user_b_id=user_b,
+            last_message_at=last_message_at,
+            last_message_preview=Truncator(last_message.body).chars(100),
+            unread_a=messages.filter(receiver_id=user_a, is_read=False).count(),
+            unread_b=messages.filter(receiver_id=user_b, is_read=False).count(),
+        )
+        messages.update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_userprofile_interests_bitmask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, max_length=120)),
+                ('unread_a', models.PositiveIntegerField(default=0)),
+                ('unread_b', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_a',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_b',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='app.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-sent_date'], name='message_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_a', '-last_message_at'], name='conversation_user_a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_b', '-last_message_at'], name='conversation_user_b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_a', 'user_b'), name='conversation_pair_unique'),
+        ),
+        migrations.RunPython(create_conversations, migrations.RunPython.noop),
+    ]
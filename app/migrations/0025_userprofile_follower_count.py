@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_followers(apps, schema_editor):
+    UserProfile = apps.get_model('app', 'UserProfile')
+    Like = UserProfile.followers.through
+
+    likes = Like.objects.filter(userprofile=OuterRef('pk')).order_by() \
+        .values('userprofile').annotate(total=Count('id')).values('total')
+    UserProfile.objects.update(follower_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_content_addressed_profile_pics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:26
+
+import app.models
+import app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_userprofile_follower_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_pic',
+            field=models.ImageField(db_index=True, default='profile_pics/default.png', storage=app.storage.ProfilePictureStorage(), upload_to=app.models.profile_pic_path),
+        ),
+    ]
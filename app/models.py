@@ -1,14 +1,16 @@
 import os
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Q, F, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Substr
 from django.utils import timezone
+from django.utils.text import Truncator
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django_countries.fields import CountryField
 from datetime import date, timedelta
 from multiselectfield import MultiSelectField
+from . import notifications, tasks, unread
+from .storage import profile_pic_storage
 
 
 ################## USER ACCOUNT #####################################################
@@ -30,9 +32,7 @@ class UserManager(BaseUserManager):
     def create_user(self, username=None, email=None, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', False)
         extra_fields.setdefault('is_superuser', False)
-        user = self._create_user(username, email, password, **extra_fields)
-        UserProfile.objects.create(user=user)
-        return user
+        return self._create_user(username, email, password, **extra_fields)
 
     def create_superuser(self, username=None, email=None, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
@@ -40,6 +40,14 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_active', True)
         return self._create_user(username, email, password, **extra_fields)
 
+    def for_profile_details(self):
+        # kolumny czytane przez user_profile_detail.html - profil w tym samym zapytaniu
+        return self.select_related('userprofile').only(
+            'username', 'first_name', 'last_name', 'sex',
+            'userprofile__profile_pic', 'userprofile__age', 'userprofile__follower_count',
+            'userprofile__country', 'userprofile__bio', 'userprofile__interests', 'userprofile__education',
+            'userprofile__job', 'userprofile__languages')
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     CHOICES = [
@@ -64,29 +72,41 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_match_fields = (self.__dict__.get('sex'), self.__dict__.get('date_of_birth'))
+
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        if self.date_of_birth:
-            today = date.today()
-            age = today.year - self.date_of_birth.year - (
-                        (today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
-            profile, created = UserProfile.objects.get_or_create(user=self)
-            profile.age = age
-            profile.save()
+        match_fields = {'sex': self.sex, 'date_of_birth': self.date_of_birth,
+                        'age': calculate_age(self.date_of_birth)}
+        if adding:
+            # jedyne miejsce, w którym powstaje profil użytkownika
+            UserProfile.objects.create(user=self, **match_fields)
+        # profil aktualizujemy tylko, gdy zmieniła się płeć lub data urodzenia (np. nie przy logowaniu)
+        elif self._loaded_match_fields != (self.sex, self.date_of_birth):
+            if not UserProfile.objects.filter(user=self).update(**match_fields):
+                UserProfile.objects.create(user=self, **match_fields)
+            elif 'userprofile' in self._state.fields_cache:
+                for name, value in match_fields.items():
+                    setattr(self.userprofile, name, value)
+                self.userprofile._loaded_values.update(match_fields)
+        self._loaded_match_fields = (self.sex, self.date_of_birth)
+
+
+def calculate_age(date_of_birth, today=None):
+    if not date_of_birth:
+        return None
+    today = today or date.today()
+    return today.year - date_of_birth.year - (
+                (today.month, today.day) < (date_of_birth.month, date_of_birth.day))
 
 
 ################## USER PROFILE #####################################################
 
 
-@receiver(post_save, sender=User)
-def create_profile(sender, instance, created, **kwargs):
-    if created:
-        UserProfile.objects.create(user=instance)
-
-
-@receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
+DEFAULT_PROFILE_PIC = 'profile_pics/default.png'
 
 
 def user_directory_path(instance, filename):
@@ -94,6 +114,37 @@ def user_directory_path(instance, filename):
     return os.path.join('profile_pics', user_folder, filename)
 
 
+def profile_pic_path(instance, filename):
+    # ostateczną nazwę (skrót zawartości) nadaje ContentAddressedStorage
+    return os.path.join('profile_pics', filename)
+
+
+class UserProfileQuerySet(models.QuerySet):
+    def with_any_interests(self, *keys):
+        mask = UserProfile.interests_to_mask(keys)
+        return self.alias(matched_interests=F('interests').bitand(mask)).filter(matched_interests__gt=0)
+
+    def with_all_interests(self, *keys):
+        mask = UserProfile.interests_to_mask(keys)
+        return self.alias(matched_interests=F('interests').bitand(mask)).filter(matched_interests=mask)
+
+    def liked_by(self, user):
+        return self.filter(followers=user)
+
+    def accepting(self, sex, age):
+        """Profile, których preferencje (płeć, przedział wieku) obejmują osobę o płci `sex` i wieku `age`."""
+        queryset = self.filter(sex_preference__in=['', 'A', sex or ''])
+        if age is None:
+            return queryset
+        return queryset.filter(Q(min_age_preference__isnull=True) | Q(max_age_preference__isnull=True) |
+                               Q(min_age_preference__lte=age, max_age_preference__gte=age))
+
+    def for_cards(self):
+        # kolumny czytane przez profile_card.html
+        return self.select_related('user').only('user_id', 'profile_pic', 'age', 'follower_count',
+                                                'user__username', 'user__first_name')
+
+
 class UserProfile(models.Model):
     SEX_CHOICES = [
         ('W', 'Kobiety'),
@@ -101,6 +152,32 @@ class UserProfile(models.Model):
         ('O', 'Inni'),
         ('A', 'Wszyscy')]
 
+    INTEREST_CHOICES = [
+        ('movies_series', 'Filmy/seriale'),
+        ('music', 'Muzyka'),
+        ('singing', 'Śpiewanie'),
+        ('dancing', 'Taniec'),
+        ('books', 'Książki'),
+        ('poetics', 'Poezja'),
+        ('photography', 'Fotografia'),
+        ('painting_drawing', 'Malowanie/rysowanie'),
+        ('art', 'Sztuka'),
+        ('theater', 'Teatr'),
+        ('learning_languages', 'Nauka języków'),
+        ('cooking_baking', 'Gotowanie/pieczenie'),
+        ('traveling', 'Podróżowanie'),
+        ('swimming', 'Pływanie'),
+        ('cycling', 'Jazda na rowerze'),
+        ('skiing_snowboarding', 'Narty/snowboard'),
+        ('football', 'Piłka nożna'),
+        ('basketball', 'Koszykówka'),
+        ('volleyball', 'Siatkówka'),
+        ('tennis', 'Tenis'),
+        ('other_sport', 'Inny sport')]
+
+    # każde zainteresowanie to jeden bit pola `interests` (kolejność jak w INTEREST_CHOICES)
+    INTEREST_BITS = {key: 1 << index for index, (key, label) in enumerate(INTEREST_CHOICES)}
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     country = CountryField()
     education = models.CharField(max_length=200, blank=True)
@@ -108,23 +185,90 @@ class UserProfile(models.Model):
     bio = models.CharField(max_length=500, blank=True)
     age = models.PositiveIntegerField(blank=True, null=True)
     followers = models.ManyToManyField(User, related_name='following', blank=True)
-    profile_pic = models.ImageField(default='profile_pics/default.png', upload_to=user_directory_path)
+    # zdenormalizowana liczba polubień - zmieniana tylko przez set_liked()
+    follower_count = models.PositiveIntegerField(default=0, editable=False)
+    profile_pic = models.ImageField(default=DEFAULT_PROFILE_PIC, upload_to=profile_pic_path,
+                                    storage=profile_pic_storage, db_index=True)
     languages = models.CharField(max_length=200, blank=True)
-    interests = models.CharField(max_length=500, blank=True)
+    interests = models.PositiveIntegerField(default=0)
     min_age_preference = models.PositiveIntegerField(blank=True, null=True)
     max_age_preference = models.PositiveIntegerField(blank=True, null=True)
     sex_preference = models.CharField(max_length=1, choices=SEX_CHOICES, blank=True)
 
+    # zdenormalizowane z User, żeby lista profili była jednym zapytaniem po indeksie
+    sex = models.CharField(max_length=1, choices=User.CHOICES, blank=True, editable=False)
+    date_of_birth = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sex', 'date_of_birth'], name='profile_match_idx'),
+            models.Index(fields=['date_of_birth'], name='profile_birth_idx'),
+        ]
+
+    objects = UserProfileQuerySet.as_manager()
+
+    @classmethod
+    def interests_to_mask(cls, keys):
+        return sum(cls.INTEREST_BITS[key] for key in set(keys) if key in cls.INTEREST_BITS)
+
+    def interest_keys(self):
+        return [key for key, label in self.INTEREST_CHOICES if self.interests & self.INTEREST_BITS[key]]
+
+    def get_interests_display(self):
+        return ', '.join(label for key, label in self.INTEREST_CHOICES if self.interests & self.INTEREST_BITS[key])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_values = self._tracked_values()
+
+    def _tracked_values(self):
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                values[field.attname] = getattr(value, 'name', value) if isinstance(field, models.FileField) else value
+        return values
+
+    def changed_fields(self):
+        current = self._tracked_values()
+        return [name for name, value in current.items()
+                if name in self._loaded_values and self._loaded_values[name] != value]
 
     def save(self, *args, **kwargs):
-        try:
-            old_profile = UserProfile.objects.get(pk=self.pk)
-            if old_profile.profile_pic != self.profile_pic:
-                old_profile.profile_pic.delete(save=False)  # Delete the old profile picture from the database
-        except UserProfile.DoesNotExist:
-            pass
+        if not self._state.adding and 'update_fields' not in kwargs:
+            changed = self.changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+
+        old_picture = self._loaded_values.get('profile_pic')
         super(UserProfile, self).save(*args, **kwargs)
 
+        if old_picture != self.profile_pic.name:
+            # przetwarzanie plików odbywa się poza żądaniem (app.tasks)
+            if self.profile_pic and self.profile_pic.name != DEFAULT_PROFILE_PIC:
+                tasks.enqueue('generate_profile_renditions', name=self.profile_pic.name)
+            if old_picture and old_picture != DEFAULT_PROFILE_PIC:
+                tasks.enqueue('delete_profile_picture', name=old_picture)
+        self._loaded_values = self._tracked_values()
+
+    def set_liked(self, user, liked=True):
+        """Polubienie (liked=True) albo jego cofnięcie; powtórzenie niczego nie zmienia.
+        Zwraca True, jeśli stan się zmienił."""
+        from . import fragments
+
+        likes = UserProfile.followers.through.objects
+        with transaction.atomic():
+            if liked:
+                like, changed = likes.get_or_create(userprofile_id=self.pk, user_id=user.pk)
+            else:
+                changed = likes.filter(userprofile_id=self.pk, user_id=user.pk).delete()[0] > 0
+            if changed:
+                delta = 1 if liked else -1
+                UserProfile.objects.filter(pk=self.pk).update(follower_count=Greatest(F('follower_count') + delta, 0))
+                fragments.invalidate(self.user_id)
+        return changed
+
     def __str__(self):
         return self.user.username
 
@@ -132,6 +276,147 @@ class UserProfile(models.Model):
 ################## WIADOMOŚCI #####################################################
 
 
+class ConversationQuerySet(models.QuerySet):
+    def between(self, first, second):
+        user_a, user_b = sorted([first.pk, second.pk])
+        return self.filter(user_a_id=user_a, user_b_id=user_b)
+
+    def for_pair(self, first, second):
+        user_a, user_b = sorted([first.pk, second.pk])
+        conversation, created = self.get_or_create(user_a_id=user_a, user_b_id=user_b)
+        return conversation
+
+    def for_user(self, user):
+        return self.filter(Q(user_a=user) | Q(user_b=user)).select_related('user_a', 'user_b') \
+            .order_by('-last_message_at', '-id')
+
+    def refresh_summary(self):
+        # przelicza podsumowania rozmów jednym UPDATE (po operacjach hurtowych na listach)
+        letters = Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_date', '-id')
+
+        def unread_count(participant):
+            return Coalesce(Subquery(
+                letters.filter(receiver=OuterRef(participant), is_read=False).order_by()
+                .values('conversation').annotate(total=Count('id')).values('total')
+            ), 0)
+
+        return self.update(
+            last_message_at=Subquery(letters.values('sent_date')[:1]),
+            last_message_preview=Coalesce(Substr(Subquery(letters.values('body')[:1]), 1, 100), Value('')),
+            unread_a=unread_count('user_a'),
+            unread_b=unread_count('user_b'),
+        )
+
+
+class Conversation(models.Model):
+    # para użytkowników zawsze zapisana jako (mniejsze id, większe id)
+    user_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=120, blank=True)
+    unread_a = models.PositiveIntegerField(default=0)
+    unread_b = models.PositiveIntegerField(default=0)
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_a', 'user_b'], name='conversation_pair_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user_a', '-last_message_at'], name='conversation_user_a_idx'),
+            models.Index(fields=['user_b', '-last_message_at'], name='conversation_user_b_idx'),
+        ]
+
+    def __str__(self):
+        return '%s - %s' % (self.user_a, self.user_b)
+
+    @staticmethod
+    def unread_field(user_a_id, user_id):
+        return 'unread_a' if user_id == user_a_id else 'unread_b'
+
+    def other(self, user):
+        return self.user_b if user.pk == self.user_a_id else self.user_a
+
+    def unread_for(self, user):
+        return getattr(self, self.unread_field(self.user_a_id, user.pk))
+
+    def record_message(self, message):
+        field = self.unread_field(self.user_a_id, message.receiver_id)
+        Conversation.objects.filter(pk=self.pk).update(
+            last_message_at=message.sent_date,
+            last_message_preview=Truncator(message.body).chars(100),
+            **{field: F(field) + 1},
+        )
+
+    def mark_read(self, user):
+        """Oznacza wszystkie listy do `user` w tej rozmowie jako przeczytane."""
+        with transaction.atomic():
+            updated = self.messages.filter(receiver=user, is_read=False).update(is_read=True)
+            Conversation.objects.filter(pk=self.pk).update(**{self.unread_field(self.user_a_id, user.pk): 0})
+            if updated:
+                unread.decrement(user.pk, updated)
+        setattr(self, self.unread_field(self.user_a_id, user.pk), 0)
+        return updated
+
+
+class MessageQuerySet(models.QuerySet):
+    MAILBOX_FILTERS = {
+        'received': lambda user: Q(receiver=user),
+        'sent': lambda user: Q(sender=user),
+        'read': lambda user: Q(receiver=user, is_read=True),
+        'unread': lambda user: Q(receiver=user, is_read=False),
+        'all': lambda user: Q(sender=user) | Q(receiver=user),
+    }
+
+    def mailbox(self, user, option='received'):
+        condition = self.MAILBOX_FILTERS.get(option, self.MAILBOX_FILTERS['received'])(user)
+        return self.filter(condition).for_inbox().order_by('-sent_date', '-id')
+
+    def for_inbox(self):
+        # kolumny czytane przez inbox.html (bez treści listów)
+        return self.select_related('sender', 'receiver').only(
+            'subject', 'sent_date', 'is_read', 'sender__username', 'receiver__username')
+
+    ################## operacje hurtowe - jedno UPDATE / DELETE niezależnie od liczby listów
+
+    def _affected(self):
+        return list(self.order_by().values_list('conversation_id', 'receiver_id').distinct())
+
+    def _refresh(self, affected):
+        Conversation.objects.filter(id__in={conversation for conversation, receiver in affected}).refresh_summary()
+        for receiver_id in {receiver for conversation, receiver in affected}:
+            unread.invalidate(receiver_id)
+
+    def _set_read(self, value):
+        letters = self.filter(is_read=not value)
+        with transaction.atomic():
+            affected = letters._affected()
+            updated = letters.update(is_read=value)
+            self._refresh(affected)
+        return updated
+
+    def mark_read(self):
+        return self._set_read(True)
+
+    def mark_unread(self):
+        return self._set_read(False)
+
+    def batch_delete(self):
+        from .search import get_backend
+
+        letters = self.order_by()
+        with transaction.atomic():
+            affected = letters._affected()
+            get_backend().remove_queryset(letters)
+            # _raw_delete pomija pobieranie obiektów i sygnały - indeks wyszukiwania czyścimy wyżej
+            deleted = letters._raw_delete(letters.db)
+            self._refresh(affected)
+            Conversation.objects.filter(id__in={conversation for conversation, receiver in affected},
+                                        last_message_at=None).delete()
+        return deleted
+
+
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
@@ -143,9 +428,73 @@ class Message(models.Model):
     font_family = models.CharField(max_length=50, blank=True)
     font_size = models.CharField(max_length=5, blank=True)
     picture = models.CharField(max_length=50, blank=True)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages',
+                                     null=True, blank=True)
+
+    objects = MessageQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', '-sent_date'], name='message_receiver_sent_idx'),
+            models.Index(fields=['sender', '-sent_date'], name='message_sender_sent_idx'),
+            models.Index(fields=['conversation', '-sent_date'], name='message_conversation_idx'),
+        ]
 
     def __str__(self):
         return self.subject
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        # nowy list: zapis listu i aktualizacja rozmowy w jednej transakcji
+        with transaction.atomic():
+            if self.conversation_id is None:
+                self.conversation = Conversation.objects.for_pair(self.sender, self.receiver)
+            super().save(*args, **kwargs)
+            self.conversation.record_message(self)
+            unread.increment(self.receiver_id)
+            notifications.letter_sent(self)
+
+    def mark_read(self):
+        if self.is_read:
+            return False
+        with transaction.atomic():
+            updated = Message.objects.filter(pk=self.pk, is_read=False).update(is_read=True)
+            if updated and self.conversation_id:
+                field = Conversation.unread_field(min(self.sender_id, self.receiver_id), self.receiver_id)
+                Conversation.objects.filter(pk=self.conversation_id).update(**{field: Greatest(F(field) - 1, 0)})
+            if updated:
+                unread.decrement(self.receiver_id)
+        self.is_read = True
+        return bool(updated)
+
+
+################## ZADANIA W TLE #####################################################
+
+
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Oczekuje'),
+        (RUNNING, 'W trakcie'),
+        (FAILED, 'Nieudane')]
+
+    name = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_queue_idx'),
+        ]
 
+    def __str__(self):
+        return '%s (%s)' % (self.name, self.status)
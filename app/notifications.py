@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from django.utils.text import Truncator
+
+from . import unread
+
+
+# Powiadomienia o nowych listach wysyłane do otwartych kart odbiorcy (kanał SSE
+# w app.async_views.letter_events). Broker rozsyła zdarzenia do subskrybentów
+# danego użytkownika; domyślny działa w obrębie jednego procesu, przy kilku
+# workerach ASGI trzeba podmienić go (NOTIFICATION_BROKER) na wspólny, np. Redis pub/sub.
+
+################## BROKERY #####################################################
+
+class Broker(ABC):
+    @abstractmethod
+    def subscribe(self, user_id):
+        """Zwraca kolejkę asyncio, do której trafiają zdarzenia użytkownika."""
+
+    @abstractmethod
+    def unsubscribe(self, user_id, queue):
+        pass
+
+    @abstractmethod
+    def publish(self, user_id, event):
+        pass
+
+    @abstractmethod
+    def subscriber_count(self, user_id):
+        """Liczba otwartych kanałów użytkownika (0 - nie ma komu wysyłać zdarzeń)."""
+
+
+class InProcessBroker(Broker):
+    # publish jest wołany z wątków synchronicznych (zapis listu), a kolejki
+    # należą do pętli zdarzeń - stąd call_soon_threadsafe
+    max_queue_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, {}).items())
+        for queue, loop in queues:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                self.unsubscribe(user_id, queue)  # pętla już zamknięta
+
+    @staticmethod
+    def _put(queue, event):
+        if queue.full():  # karta, która nie odbiera zdarzeń, traci najstarsze
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def subscriber_count(self, user_id):
+        with self._lock:
+            return len(self._subscribers.get(user_id, {}))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    path = getattr(settings, 'NOTIFICATION_BROKER', 'app.notifications.InProcessBroker')
+    return import_string(path)()
+
+
+################## ZDARZENIA #####################################################
+
+def format_event(name, data):
+    return 'event: %s\ndata: %s\n\n' % (name, json.dumps(data))
+
+
+def letter_sent(message):
+    """Po zatwierdzeniu transakcji powiadamia odbiorcę o nowym liście."""
+    def publish():
+        broker = get_broker()
+        # bez otwartej karty (zawsze pod WSGI) nie ma po co liczyć nieprzeczytanych
+        if not broker.subscriber_count(message.receiver_id):
+            return
+        broker.publish(message.receiver_id, {
+            'unread': unread.get_unread_count(message.receiver),
+            'sender': message.sender.username,
+            'subject': Truncator(message.subject).chars(60),
+            'preview': Truncator(message.body).chars(80),
+            'url': reverse('app:view_message', args=[message.pk]),
+        })
+    transaction.on_commit(publish)
@@ -0,0 +1,75 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# Stronicowanie "keyset" po (sent_date, id) - koszt strony nie zależy od tego,
+# jak daleko w skrzynce jest użytkownik (brak OFFSET).
+
+def encode_cursor(message):
+    raw = '%s|%d' % (message.sent_date.isoformat(), message.id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        sent_date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(sent_date), int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, older_cursor=None, newer_cursor=None):
+        self.items = items
+        self.older_cursor = older_cursor
+        self.newer_cursor = newer_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _keyset_query(queryset, older, newer, per_page):
+    newer_key = decode_cursor(newer) if newer else None
+    older_key = decode_cursor(older) if older and not newer_key else None
+
+    if newer_key:
+        sent_date, pk = newer_key
+        queryset = queryset.filter(
+            Q(sent_date__gt=sent_date) | Q(sent_date=sent_date, id__gt=pk)
+        ).order_by('sent_date', 'id')
+    elif older_key:
+        sent_date, pk = older_key
+        queryset = queryset.filter(Q(sent_date__lt=sent_date) | Q(sent_date=sent_date, id__lt=pk))
+    return queryset[:per_page + 1], newer_key is not None, older_key is not None
+
+
+def _keyset_result(rows, from_newer, from_older, per_page):
+    if from_newer:
+        has_newer = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_older = True
+    else:
+        has_older = len(rows) > per_page
+        items = rows[:per_page]
+        has_newer = from_older
+
+    if not items:
+        return KeysetPage(items)
+    return KeysetPage(
+        items,
+        older_cursor=encode_cursor(items[-1]) if has_older else None,
+        newer_cursor=encode_cursor(items[0]) if has_newer else None,
+    )
+
+
+def keyset_page(queryset, older=None, newer=None, per_page=20):
+    """Zwraca stronę z querysetu posortowanego po ('-sent_date', '-id')."""
+    queryset, from_newer, from_older = _keyset_query(queryset, older, newer, per_page)
+    return _keyset_result(list(queryset), from_newer, from_older, per_page)
+
+
+async def akeyset_page(queryset, older=None, newer=None, per_page=20):
+    queryset, from_newer, from_older = _keyset_query(queryset, older, newer, per_page)
+    return _keyset_result([item async for item in queryset], from_newer, from_older, per_page)
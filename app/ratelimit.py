@@ -0,0 +1,149 @@
+import ipaddress
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+
+# Limit prób logowania / rejestracji / resetu hasła: kubełek żetonów osobno dla
+# adresu IP i dla adresu e-mail z formularza. Każdy POST zabiera żeton, żetony
+# wracają ze stałą szybkością. Pusty kubełek oznacza odpowiedź 429 - zanim
+# widok sięgnie do bazy i zacznie hashować hasło.
+#
+# Kubełek e-mail jest liczony dla pary (e-mail, IP): ktoś, kto zgaduje hasło
+# cudzego konta, wyczerpuje go tylko dla swojego adresu i nie blokuje logowania
+# właścicielowi. Zgadywanie hasła jednego konta z wielu adresów ogranicza
+# wyłącznie koszt scrypt (app.hashers) i kubełki 'ip' poszczególnych adresów.
+
+DEFAULT_RATES = {
+    # (pojemność kubełka, żetony na minutę)
+    'ip': (20, 10),
+    'email': (5, 2),
+}
+
+
+################## MAGAZYNY #####################################################
+
+class Store(ABC):
+    @abstractmethod
+    def take(self, key, capacity, rate):
+        """Zabiera żeton z kubełka `key` (rate - żetony na sekundę).
+        Zwraca 0, jeśli się udało, a w przeciwnym razie liczbę sekund do następnego żetonu."""
+
+    @staticmethod
+    def _take(bucket, capacity, rate, now):
+        # (tokens, updated) -> (nowy stan kubełka, sekundy oczekiwania)
+        tokens, updated = bucket or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            return (tokens - 1, now), 0
+        return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryStore(Store):
+    # kubełki w pamięci procesu; najdawniej używane są zapominane (zapomniany
+    # kubełek to pełny kubełek, więc limit może być tylko łagodniejszy)
+    max_keys = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[key], wait = self._take(self._buckets.pop(key, None), capacity, rate, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheStore(Store):
+    # kubełki we wspólnym cache (CACHE_BACKEND=file/db) - limit obowiązuje we
+    # wszystkich procesach; odczyt i zapis nie są atomowe, więc przy równoczesnych
+    # żądaniach limit jest przybliżony
+    def take(self, key, capacity, rate):
+        key = 'ratelimit:%s' % key
+        bucket, wait = self._take(cache.get(key), capacity, rate, time.time())
+        # po czasie pełnego napełnienia wpis niczego nie zmienia - może wygasnąć
+        cache.set(key, bucket, math.ceil(capacity / rate))
+        return wait
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    path = getattr(settings, 'RATELIMIT_STORE', 'app.ratelimit.MemoryStore')
+    return import_string(path)()
+
+
+################## DEKORATOR #####################################################
+
+@lru_cache(maxsize=None)
+def _networks(proxies):
+    return [ipaddress.ip_network(proxy, strict=False) for proxy in proxies]
+
+
+def _trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request):
+    """Adres klienta: REMOTE_ADDR, a jeśli to zaufane proxy - pierwszy od prawej
+    adres z X-Forwarded-For, który nie należy do zaufanych proxy."""
+    address = request.META.get('REMOTE_ADDR', '')
+    networks = _networks(tuple(getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', ())))
+    if not _trusted(address, networks):
+        return address
+    # wpisy dopisywane przez kolejne proxy są na końcu; wcześniejsze podaje klient
+    for forwarded in reversed(request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')):
+        forwarded = forwarded.strip()
+        if not forwarded:
+            break
+        address = forwarded
+        if not _trusted(address, networks):
+            break
+    return address
+
+
+def ratelimit(scope, email_field='email'):
+    """Ogranicza liczbę POST-ów do widoku (osobno dla każdego `scope`)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST' and getattr(settings, 'RATELIMIT_ENABLED', True):
+                wait = check(scope, client_ip(request), request.POST.get(email_field, ''))
+                if wait:
+                    response = HttpResponse('Zbyt wiele prób. Spróbuj ponownie za chwilę.',
+                                            status=429, content_type='text/plain; charset=utf-8')
+                    response['Retry-After'] = str(math.ceil(wait))
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def check(scope, ip, email=''):
+    rates = getattr(settings, 'RATELIMIT_RATES', DEFAULT_RATES)
+    store = get_store()
+    wait = 0
+    email = email.strip().lower()
+    for kind, value in (('ip', ip), ('email', email and '%s:%s' % (email, ip))):
+        if value:
+            capacity, per_minute = rates[kind]
+            wait = max(wait, store.take('%s:%s:%s' % (scope, kind, value), capacity, per_minute / 60))
+    return wait
@@ -0,0 +1,118 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+# Odczyty w wybranych widokach (@replica_reads) idą do repliki 'replica', zapisy
+# zawsze do 'default'. Po zapisie sesja użytkownika jest przez REPLICA_PIN_SECONDS
+# przypięta do bazy głównej, żeby widział własne zmiany mimo opóźnienia repliki.
+
+REPLICA = 'replica'
+PIN_SESSION_KEY = '_primary_until'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_writes = ContextVar('writes', default=None)
+
+
+def has_replica():
+    return REPLICA in connections.settings
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and has_replica():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None and model._meta.app_label == 'app':
+            writes.append(model._meta.label)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+@contextmanager
+def primary():
+    """Odczyty w bloku idą do bazy głównej (np. dane, które trafią do cache)."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def is_pinned(request):
+    return request.session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def replica_reads(view):
+    """Widok tylko do odczytu: czyta z repliki, chyba że sesja jest przypięta do bazy głównej."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica_reads.set(not await sync_to_async(is_pinned)(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_reads.set(not is_pinned(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaPinningMiddleware:
+    """Przypina sesję do bazy głównej po żądaniu, które zapisało coś w modelach aplikacji."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = []
+        token = _writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _writes.reset(token)
+        if writes:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        writes = []
+        token = _writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _writes.reset(token)
+        if writes:
+            await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        if has_replica() and hasattr(request, 'session'):
+            request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 10)
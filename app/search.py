@@ -0,0 +1,134 @@
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Message
+
+
+################## NORMALIZACJA #####################################################
+
+# unicode61 z remove_diacritics zdejmuje ogonki (ą, ę, ś, ...), ale "ł" nie jest
+# znakiem z diakrytykiem w sensie Unicode, więc składamy go ręcznie.
+POLISH_FOLD = str.maketrans('łŁ', 'lL')
+
+
+def fold(text):
+    return (text or '').translate(POLISH_FOLD)
+
+
+def match_expression(query):
+    terms = re.findall(r'\w+', fold(query))
+    return ' '.join('"%s"*' % term for term in terms)
+
+
+################## BACKENDY #####################################################
+
+class SearchBackend(ABC):
+    # index/remove/rebuild utrzymują osobny indeks - backend szukający wprost
+    # w tabeli listów może ich nie nadpisywać
+    def index(self, message):
+        pass
+
+    def remove(self, message_id):
+        pass
+
+    def remove_queryset(self, queryset):
+        pass
+
+    def rebuild(self):
+        pass
+
+    @abstractmethod
+    def search(self, queryset, query):
+        """Zawęża `queryset` listów do pasujących do `query`, najtrafniejsze pierwsze."""
+
+
+class DatabaseSearchBackend(SearchBackend):
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(subject__icontains=query) |
+            Q(body__icontains=query) |
+            Q(receiver__first_name__icontains=query) |
+            Q(receiver__username__icontains=query)
+        )
+
+
+class SQLiteFTSBackend(SearchBackend):
+    table = 'app_message_search'
+
+    def _row(self, message):
+        people = ' '.join([message.receiver.first_name, message.receiver.username,
+                           message.sender.first_name, message.sender.username])
+        return [message.id, fold(message.subject), fold(message.body), fold(people)]
+
+    def index(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT OR REPLACE INTO %s (rowid, subject, body, people) VALUES (%%s, %%s, %%s, %%s)' % self.table,
+                self._row(message))
+
+    def remove(self, message_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % self.table, [message_id])
+
+    def remove_queryset(self, queryset):
+        sql, params = queryset.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (self.table, sql), params)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % self.table)
+        for message in Message.objects.select_related('sender', 'receiver').iterator(chunk_size=1000):
+            self.index(message)
+
+    def search(self, queryset, query):
+        expression = match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.extra(
+            tables=[self.table],
+            where=['%s.rowid = %s.id' % (self.table, Message._meta.db_table), '%s MATCH %%s' % self.table],
+            params=[expression],
+            order_by=['%s.rank' % self.table],
+        )
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    path = getattr(settings, 'MESSAGE_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
+
+
+def search_page(queryset, query, page_number=None, per_page=20):
+    """Wyniki posortowane według trafności, podzielone na strony."""
+    return Paginator(get_backend().search(queryset, query), per_page).get_page(page_number)
+
+
+################## SYNCHRONIZACJA #####################################################
+
+INDEXED_FIELDS = {'subject', 'body', 'sender', 'receiver'}
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Message)
+def remove_message(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
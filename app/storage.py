@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import io
+import os
+import posixpath
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+from PIL import Image, features
+
+from .images import strip_metadata
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Zapisuje pliki pod nazwą wyznaczoną z ich zawartości (SHA-256).
+
+    profile_pics/zdjecie.jpg -> profile_pics/3f/3fa4...e1.jpg
+
+    Identyczne pliki trafiają pod ten sam adres, więc są zapisywane raz, a adres
+    nigdy nie zmienia zawartości i może być cache'owany "na zawsze". Pliki, których
+    nazwa już jest adresem (albo z niego pochodzi, np. miniatury
+    `<hash>.thumb.webp`), zapisywane są pod podaną nazwą.
+    """
+
+    hashed_name_re = re.compile(r'(^|/)[0-9a-f]{64}(\.[\w.]+)?$')
+
+    def is_content_addressed(self, name):
+        return bool(self.hashed_name_re.search(name or ''))
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory = posixpath.dirname(name.replace(os.sep, '/'))
+        extension = os.path.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+
+    def prepare(self, name, content):
+        """Zmiany zawartości przed wyznaczeniem adresu - później plik już się nie zmienia."""
+        return content
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if self.is_content_addressed(name):
+            return super().save(name, content, max_length)
+        content = self.prepare(name, content)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # ta sama zawartość jest już zapisana; świeży czas modyfikacji chroni plik
+            # przed usuwaniem nieużywanych zdjęć, zanim profil zapisze jego adres
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+class ProfilePictureStorage(ContentAddressedStorage):
+    def prepare(self, name, content):
+        return strip_metadata(content)
+
+
+profile_pic_storage = ProfilePictureStorage()
+
+
+################## PLIKI STATYCZNE #####################################################
+
+# Warianty obrazków generowane przy collectstatic, w kolejności preferencji.
+STATIC_IMAGE_VARIANTS = [('avif', 'image/avif'), ('webp', 'image/webp')]
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.ico', '.txt')
+CSS_BACKGROUND_RE = re.compile(r'^(?P<indent>[ \t]*)background-image:\s*url\([\'"]?(?P<url>[^\'")]+)[\'"]?\);',
+                               re.MULTILINE)
+
+
+def variant_name(name, extension):
+    return '%s.%s' % (os.path.splitext(name)[0], extension)
+
+
+class OptimizedStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, który dodatkowo przy `collectstatic`:
+
+    - bezstratnie przepakowuje PNG (zostawia mniejszą wersję),
+    - obok PNG/JPG zapisuje warianty WebP/AVIF (tylko jeśli są mniejsze),
+      które trafiają do manifestu jak zwykłe pliki - tag `{% picture %}`
+      podaje je przeglądarce w <picture>, a w CSS dopisywane jest image-set(),
+    - zapisuje obok CSS/JS skompresowane kopie .gz (i .br, jeśli jest pakiet
+      brotli) do serwowania przez serwer WWW (np. gzip_static w nginx).
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            generated = {}
+            for name in [name for name in paths if name.lower().endswith(('.png', '.jpg', '.jpeg'))]:
+                self._optimize_image(name)
+                # hash liczony z przepakowanej kopii, a nie z pliku źródłowego
+                paths[name] = (self, name)
+                generated[name] = self._save_variants(name)
+                for extension in generated[name]:
+                    paths[variant_name(name, extension)] = (self, variant_name(name, extension))
+            for name in [name for name in paths if name.endswith('.css')]:
+                if self._add_css_variants(name, generated):
+                    paths[name] = (self, name)
+
+        for original, processed, done in super().post_process(paths, dry_run, **options):
+            if not dry_run and processed and not isinstance(done, Exception):
+                for name in (original, processed):
+                    if name.endswith(COMPRESSED_EXTENSIONS):
+                        self._compress(name)
+            yield original, processed, done
+
+    def variants(self, name):
+        """[(typ MIME, adres)] wariantów obrazka, które zostały wygenerowane."""
+        return [(mime_type, self.url(variant_name(name, extension)))
+                for extension, mime_type in STATIC_IMAGE_VARIANTS
+                if self.stored_name_or_none(variant_name(name, extension))]
+
+    def stored_name_or_none(self, name):
+        return self.hashed_files.get(self.hash_key(self.clean_name(name)))
+
+    def _optimize_image(self, name):
+        if not name.lower().endswith('.png'):
+            return  # JPEG nie da się przepakować bez strat samym Pillow
+        path = self.path(name)
+        with Image.open(path) as image:
+            image.load()
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', optimize=True)
+        if buffer.tell() < os.path.getsize(path):
+            with open(path, 'wb') as file:
+                file.write(buffer.getvalue())
+
+    def _save_variants(self, name):
+        # wariant zostaje tylko, jeśli jest mniejszy od oryginału i od mniej
+        # preferowanych wariantów
+        saved = []
+        max_size = os.path.getsize(self.path(name))
+        with Image.open(self.path(name)) as image:
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            for extension, _ in reversed(STATIC_IMAGE_VARIANTS):
+                if not features.check(extension):
+                    continue
+                buffer = io.BytesIO()
+                image.save(buffer, extension.upper(), quality=80)
+                if buffer.tell() >= max_size:
+                    continue
+                with open(self.path(variant_name(name, extension)), 'wb') as file:
+                    file.write(buffer.getvalue())
+                saved.insert(0, extension)
+                max_size = buffer.tell()
+        return saved
+
+    def _add_css_variants(self, name, generated):
+        # background-image: url(a.png)  ->  dodatkowo image-set() z wariantami;
+        # przeglądarki bez obsługi image-set(type()) zostają przy pierwszej deklaracji
+        def add_image_set(match):
+            url = match.group('url')
+            image = posixpath.normpath(posixpath.join(posixpath.dirname(name), url))
+            if not generated.get(image):
+                return match.group(0)
+            candidates = ['url(%s) type("image/%s")' % (variant_name(url, extension), extension)
+                          for extension in generated[image]]
+            candidates.append('url(%s)' % url)
+            return '%s\n%sbackground-image: image-set(%s);' % (
+                match.group(0), match.group('indent'), ', '.join(candidates))
+
+        with self.open(name) as file:
+            content = file.read().decode()
+        processed = CSS_BACKGROUND_RE.sub(add_image_set, content)
+        if processed == content:
+            return False
+        with open(self.path(name), 'w', encoding='utf-8') as file:
+            file.write(processed)
+        return True
+
+    def _compress(self, name):
+        with self.open(name) as file:
+            content = file.read()
+        with gzip.open(self.path(name) + '.gz', 'wb', compresslevel=9) as file:
+            file.write(content)
+        if brotli is not None:
+            with open(self.path(name) + '.br', 'wb') as file:
+                file.write(brotli.compress(content))
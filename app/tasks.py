@@ -0,0 +1,218 @@
+import logging
+import os
+import posixpath
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .images import generate_renditions, delete_with_renditions, rendition_names
+from .storage import profile_pic_storage
+
+
+# Prosta kolejka zadań trzymana w bazie (model Task) - bez zewnętrznego brokera.
+# Zadania wykonuje wątek w procesie aplikacji (TASK_QUEUE_IN_PROCESS) albo
+# osobny worker: `python manage.py process_tasks --loop`.
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+RETRY_DELAY = timedelta(seconds=30)
+STALE_AFTER = timedelta(minutes=10)
+ERROR_DELAY = 30  # sekundy przerwy po błędzie samej kolejki
+# plik zdjęcia wgrany (albo wgrany ponownie) niedawno może właśnie trafiać do
+# profilu - usuwa go dopiero sweep_profile_pictures
+RECENT_UPLOAD_SECONDS = 5 * 60
+
+
+def task(func):
+    _registry[func.__name__] = func
+    return func
+
+
+def enqueue(task_name, /, **arguments):
+    from .models import Task
+
+    if task_name not in _registry:
+        raise ValueError('Nieznane zadanie: %s' % task_name)
+    Task.objects.create(name=task_name, arguments=arguments)
+    if getattr(settings, 'TASK_QUEUE_IN_PROCESS', False):
+        transaction.on_commit(_wake_worker)
+
+
+################## WYKONYWANIE #####################################################
+
+def _claim():
+    from .models import Task
+
+    now = timezone.now()
+    candidates = Task.objects.filter(status=Task.PENDING, run_after__lte=now) \
+        .order_by('run_after', 'id').values_list('id', flat=True)[:10]
+    for pk in candidates:
+        claimed = Task.objects.filter(pk=pk, status=Task.PENDING).update(
+            status=Task.RUNNING, locked_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def _execute(job):
+    from .models import Task
+
+    try:
+        _registry[job.name](**job.arguments)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Task.FAILED
+        else:
+            job.status = Task.PENDING
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.locked_at = None
+        job.save(update_fields=['status', 'run_after', 'locked_at', 'last_error'])
+        return False
+    Task.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def requeue_stale():
+    # zadania porzucone przez worker, który przestał działać w trakcie pracy
+    from .models import Task
+
+    return Task.objects.filter(status=Task.RUNNING, locked_at__lt=timezone.now() - STALE_AFTER) \
+        .update(status=Task.PENDING, locked_at=None)
+
+
+def next_run_at():
+    """Najbliższa chwila, w której kolejka będzie miała coś do zrobienia (ponowienie
+    zadania albo porzucenie wykonywanego); None, gdy nie ma zadań."""
+    from .models import Task
+
+    pending = Task.objects.filter(status=Task.PENDING).aggregate(at=Min('run_after'))['at']
+    running = Task.objects.filter(status=Task.RUNNING).aggregate(at=Min('locked_at'))['at']
+    moments = [moment for moment in (pending, running and running + STALE_AFTER) if moment]
+    return min(moments) if moments else None
+
+
+def run_pending(limit=None):
+    done = 0
+    while limit is None or done < limit:
+        job = _claim()
+        if job is None:
+            break
+        _execute(job)
+        done += 1
+    return done
+
+
+################## WĄTEK W PROCESIE #####################################################
+
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_worker = None
+
+
+def _wake_worker():
+    global _worker
+    with _lock:
+        _wakeup.set()
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name='task-queue', daemon=True)
+            _worker.start()
+
+
+def _work():
+    # wątek śpi do najbliższego ponowienia i kończy się dopiero przy pustej kolejce
+    global _worker
+    try:
+        while True:
+            _wakeup.clear()
+            try:
+                requeue_stale()
+                run_pending()
+                due = next_run_at()
+                delay = None if due is None else max((due - timezone.now()).total_seconds(), 0)
+            except Exception:
+                # np. "database is locked" przy pobieraniu zadania - wątek działa dalej
+                logger.exception('Błąd kolejki zadań')
+                delay = ERROR_DELAY
+            if delay is None:
+                with _lock:
+                    if not _wakeup.is_set():
+                        _worker = None
+                        return
+                continue
+            _wakeup.wait(timeout=delay)
+    finally:
+        # wątek zakończony wyjątkiem nie może blokować uruchomienia następnego
+        with _lock:
+            if _worker is threading.current_thread():
+                _worker = None
+        connections.close_all()
+
+
+################## ZADANIA #####################################################
+
+@task
+def generate_profile_renditions(name):
+    storage = profile_pic_storage
+    if all(storage.exists(rendition) for rendition in rendition_names(name)):
+        return  # ten sam plik wgrał już ktoś inny
+    generate_renditions(name, storage)
+
+    from . import fragments
+    from .models import UserProfile
+
+    # fragmenty wyrenderowane przed powstaniem miniatur wskazują na oryginał
+    fragments.invalidate(*UserProfile.objects.filter(profile_pic=name).values_list('user_id', flat=True))
+
+
+@task
+def delete_profile_picture(name):
+    from .models import UserProfile
+
+    storage = profile_pic_storage
+    # pliki są współdzielone przez profile o tej samej zawartości zdjęcia
+    with transaction.atomic():
+        if UserProfile.objects.select_for_update().filter(profile_pic=name).exists():
+            return
+        if storage.exists(name) and os.path.getmtime(storage.path(name)) > time.time() - RECENT_UPLOAD_SECONDS:
+            return
+        delete_with_renditions(name, storage)
+
+
+@task
+def sweep_profile_pictures(min_age_seconds=3600):
+    """Usuwa z MEDIA_ROOT/profile_pics pliki, do których nie odwołuje się żaden profil."""
+    from .models import UserProfile, DEFAULT_PROFILE_PIC
+
+    storage = profile_pic_storage
+    referenced = {DEFAULT_PROFILE_PIC}
+    for name in UserProfile.objects.values_list('profile_pic', flat=True).distinct().iterator():
+        referenced.add(name)
+        referenced.update(rendition_names(name))
+
+    root = storage.path('profile_pics')
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    for directory, subdirectories, files in os.walk(root):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in referenced or file_name.startswith('.') or os.path.getmtime(path) > cutoff:
+                continue
+            # profil mógł dostać ten plik po zebraniu `referenced`; miniatury
+            # `<hash>.thumb.webp` należą do zdjęcia `<hash>.<rozszerzenie>`
+            original = posixpath.join(posixpath.dirname(name), file_name.split('.')[0])
+            with transaction.atomic():
+                if UserProfile.objects.select_for_update().filter(profile_pic__startswith=original).exists():
+                    continue
+                storage.delete(name)
+            removed += 1
+    return removed
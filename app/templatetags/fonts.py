@@ -0,0 +1,43 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from app.fonts import FONTS, LETTER_FONTS, font_file, is_built, google_css_url
+
+register = template.Library()
+
+
+def _families(values):
+    for value in values:
+        if isinstance(value, str):
+            yield value
+        elif hasattr(value, 'font_family'):
+            yield value.font_family
+        elif value is not None:
+            yield from _families(value)
+
+
+@register.simple_tag
+def font_faces(*values, letters=False):
+    """@font-face dla podanych czcionek: nazw, listów (Message.font_family) lub
+    list listów; `letters=True` - wszystkie czcionki do wyboru w formularzu.
+
+    Czcionki niezbudowane przez `build_fonts` są pobierane z Google Fonts - arkusz
+    ładuje się bez blokowania renderowania (do tego czasu tekst ma czcionkę zapasową).
+    """
+    families = list(LETTER_FONTS) if letters else _families(values)
+    fonts = list(dict.fromkeys(FONTS[family] for family in families if family in FONTS))
+    local = [(font, weight) for font in fonts for weight in font.weights if is_built(font_file(font, weight))]
+    remote = [font for font in fonts if not any(font == local_font for local_font, weight in local)]
+
+    html = []
+    if local:
+        html.append(format_html('<style>{}</style>', format_html_join(
+            '', "@font-face{{font-family:'{}';font-weight:{};font-display:swap;"
+                "src:url({}) format('woff2')}}",
+            ((font.family, weight, static(font_file(font, weight))) for font, weight in local))))
+    if remote:
+        html.append(format_html('<link href="{}" rel="stylesheet" media="print" onload="this.media=\'all\'">',
+                                google_css_url(remote)))
+    return mark_safe(''.join(html))
@@ -0,0 +1,22 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(path, **attributes):
+    """<picture> z wariantami AVIF/WebP obrazka statycznego, jeśli zostały
+    wygenerowane przy collectstatic; inaczej zwykły <img>."""
+    variants = getattr(staticfiles_storage, 'variants', None)
+    sources = variants(path) if variants else []
+    img = format_html('<img src="{}"{}>', static(path),
+                      format_html_join('', ' {}="{}"', sorted(attributes.items())))
+    if not sources:
+        return img
+    return format_html('<picture>{}{}</picture>',
+                       format_html_join('', '<source srcset="{}" type="{}">',
+                                        ((url, mime_type) for mime_type, url in sources)),
+                       img)
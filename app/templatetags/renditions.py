@@ -0,0 +1,16 @@
+from django import template
+
+from app.images import rendition_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(image, name='thumb'):
+    """Adres wariantu zdjęcia (np. 'thumb'), a jeśli jeszcze nie istnieje - oryginału."""
+    if not image:
+        return ''
+    variant = rendition_name(image.name, name)
+    if image.storage.exists(variant):
+        return image.storage.url(variant)
+    return image.url
@@ -1,3 +1,872 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.contrib.auth.hashers import make_password
+from django.template import Context, Template
+from django.templatetags.static import static
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import tasks, unread
+from .benchmarks import percentile, run_threads
+from .fonts import ICONS
+from .forms import UserProfileForm
+from .images import generate_renditions, rendition_name, rendition_names
+from .matching import Viewer, cached_ranking, rank_profiles, score_rows
+from .models import Conversation, Message, Task, User, UserProfile
+from .notifications import InProcessBroker, get_broker
+from .pagination import akeyset_page, keyset_page
+from .storage import ProfilePictureStorage
+from .ratelimit import client_ip, get_store
+from .routers import PIN_SESSION_KEY, REPLICA, primary, replica_reads
+from .search import SQLiteFTSBackend, get_backend, search_page
+
+
+REGISTER_DATA = {
+    'username': 'ala',
+    'email': 'ala@example.com',
+    'password1': 'Trudne-haslo-123',
+    'password2': 'Trudne-haslo-123',
+    'first_name': 'Ala',
+    'last_name': 'Kowalska',
+    'sex': 'W',
+    'date_of_birth_year': '1995',
+    'date_of_birth_month': '5',
+    'date_of_birth_day': '5',
+}
+
+
+class UsersMixin:
+    # czysty cache i dwie użytkowniczki, zalogowana ola
+    def setUp(self):
+        cache.clear()
+        self.ola = User.objects.create(username='ola', email='ola@example.com')
+        self.ala = User.objects.create(username='ala', email='ala@example.com')
+        self.client.force_login(self.ola)
+
+
+class UsersTestCase(UsersMixin, TestCase):
+    pass
+
+
+class ProfileLifecycleQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def profile_queries(self, queries):
+        return [query['sql'] for query in queries if 'app_userprofile' in query['sql']]
+
+    def test_registration_creates_profile_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('app:register'), REGISTER_DATA)
+
+        self.assertRedirects(response, reverse('app:profile'), fetch_redirect_response=False)
+        profile_queries = self.profile_queries(queries)
+        self.assertEqual(len(profile_queries), 1)
+        self.assertTrue(profile_queries[0].startswith('INSERT'))
+        self.assertEqual(len(queries), 13)
+        profile = UserProfile.objects.get(user__email='ala@example.com')
+        self.assertEqual((profile.sex, profile.date_of_birth.year), ('W', 1995))
+
+    def test_login_does_not_touch_profile(self):
+        self.client.post(reverse('app:register'), REGISTER_DATA)
+        self.client.logout()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('app:login'), {'username': 'ala@example.com',
+                                                               'password': 'Trudne-haslo-123'})
+
+        self.assertRedirects(response, reverse('app:index'), fetch_redirect_response=False)
+        self.assertEqual(self.profile_queries(queries), [])
+        self.assertEqual(len(queries), 9)
+
+    def test_page_view_does_not_read_session_or_user(self):
+        self.client.post(reverse('app:register'), REGISTER_DATA)
+        self.client.get(reverse('app:index'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('app:index'))
+
+        self.assertTrue(response.context['user'].is_authenticated)
+        self.assertEqual(len(queries), 0)
+
+    def test_unchanged_profile_is_not_written(self):
+        self.client.post(reverse('app:register'), REGISTER_DATA)
+        data = {'country': 'PL', 'sex_preference': 'A', 'bio': 'Cześć'}
+        self.client.post(reverse('app:profile_settings'), data)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('app:profile_settings'), data)
+
+        self.assertEqual(len(self.profile_queries(queries)), 1)
+        self.assertTrue(self.profile_queries(queries)[0].startswith('SELECT'))
+
+    def test_changing_sex_updates_profile_without_refetch(self):
+        user = User.objects.create_user(username='ola', email='ola@example.com', password='x')
+        user = User.objects.get(pk=user.pk)
+        user.sex = 'W'
+
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+
+        profile_queries = self.profile_queries(queries)
+        self.assertEqual(len(profile_queries), 1)
+        self.assertTrue(profile_queries[0].startswith('UPDATE'))
+        self.assertEqual(UserProfile.objects.get(user=user).sex, 'W')
+
+
+class ProfileFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create(username='ola', email='ola@example.com')
+        self.other = User.objects.create(username='ala', email='ala@example.com', first_name='Ala')
+        self.client.force_login(self.viewer)
+
+    def test_detail_is_cached_until_profile_changes(self):
+        url = reverse('app:user_profile', args=[self.other.pk])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Ala')
+        self.assertEqual(self.profile_queries(queries), [])
+
+        profile = UserProfile.objects.get(user=self.other)
+        profile.bio = 'Lubię listy'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertContains(self.client.get(url), 'Lubię listy')
+
+    def profile_queries(self, queries):
+        # stan polubienia (app_userprofile_followers) zależy od oglądającego i nie jest cache'owany
+        return [query['sql'] for query in queries
+                if 'app_userprofile' in query['sql'] and 'app_userprofile_followers' not in query['sql']]
+
+
+class LikeTests(UsersTestCase):
+    def like(self, user, liked='1'):
+        return self.client.post(reverse('app:like_profile', args=[user.pk]), {'liked': liked})
+
+    def test_like_is_idempotent_and_counted(self):
+        self.like(self.ala)
+        self.like(self.ala)
+        self.assertEqual(UserProfile.objects.get(user=self.ala).follower_count, 1)
+
+        self.like(self.ala, liked='0')
+        self.like(self.ala, liked='0')
+        self.assertEqual(UserProfile.objects.get(user=self.ala).follower_count, 0)
+
+    def test_mutual_likes(self):
+        self.like(self.ala)
+        self.assertNotContains(self.client.get(reverse('app:likes') + '?show=mutual'), 'Zdjęcie użytkownika ala')
+
+        self.ola.userprofile.set_liked(self.ala)
+        self.assertContains(self.client.get(reverse('app:likes') + '?show=mutual'), 'Zdjęcie użytkownika ala')
+
+
+class ConstantQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create(username='ola', email='ola@example.com')
+        self.client.force_login(self.viewer)
+
+    def add_people(self, count):
+        start = User.objects.count()
+        for number in range(start, start + count):
+            user = User.objects.create(username='user%d' % number, email='user%d@example.com' % number)
+            Message.objects.create(sender=user, receiver=self.viewer, subject='Cześć', body='Treść')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for name in ('app:profile_list', 'app:inbox'):
+            with self.subTest(name):
+                self.add_people(2)
+                few = self.count_queries(reverse(name))
+                self.add_people(8)
+                self.assertEqual(self.count_queries(reverse(name)), few)
+
+
+class MatchRankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create(username='ola', email='ola@example.com')
+        users = User.objects.bulk_create(
+            [User(username='user%d' % number, email='user%d@example.com' % number) for number in range(530)])
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        self.client.force_login(self.viewer)
+
+    def test_every_page_is_reachable_and_later_pages_come_from_cache(self):
+        self.assertEqual(len(self.client.get(reverse('app:profile_list')).context['profiles']), 24)
+        with mock.patch('app.matching.rank_profiles') as rank_profiles:
+            response = self.client.get(reverse('app:profile_list') + '?page=23')
+        rank_profiles.assert_not_called()
+        self.assertEqual(len(response.context['profiles']), 2)
+
+    def test_pages_past_the_cached_prefix(self):
+        viewer = self.viewer.userprofile
+        candidates = UserProfile.objects.exclude(user=self.viewer)
+        full, total = rank_profiles(viewer, candidates)
+        with mock.patch('app.matching.RANKING_CACHE_SIZE', 10):
+            self.assertEqual(list(cached_ranking(viewer, candidates, 24)[:24]), full[:24])
+            deep = cached_ranking(viewer, candidates, 48)
+        self.assertEqual((list(deep[24:48]), len(deep)), (full[24:48], total))
+        self.assertEqual(total, 530)
+
+
+class MatchScoringTests(TestCase):
+    def test_score_rows(self):
+        viewer = Viewer('W', 30, 0b0111)
+        rows = [(1, 30, 0), (2, 30, 0b0011), (3, 40, 0b0111), (4, 31, 0b0011), (5, None, 0b0001)]
+        self.assertEqual(score_rows(viewer, rows), [(20, 2), (20, 3), (19, 4), (10, 5), (0, 1)])
+        self.assertEqual(score_rows(viewer, rows, limit=2), [(20, 2), (20, 3)])
+
+    def test_candidates_must_accept_the_viewer(self):
+        viewer = User.objects.create(username='ola', email='ola@example.com').userprofile
+        viewer.sex, viewer.age = 'W', 30
+        preferences = {'any': ('A', None, None), 'unset': ('', None, None), 'women': ('W', 25, 35),
+                       'men': ('M', None, None), 'older': ('W', 40, 50), 'open_range': ('W', 40, None)}
+        for username, (sex, min_age, max_age) in preferences.items():
+            UserProfile.objects.filter(user=User.objects.create(username=username, email=username + '@example.com')) \
+                .update(sex_preference=sex, min_age_preference=min_age, max_age_preference=max_age)
+
+        ids, total = rank_profiles(viewer, UserProfile.objects.exclude(pk=viewer.pk))
+        matched = set(UserProfile.objects.filter(pk__in=ids).values_list('user__username', flat=True))
+        self.assertEqual((matched, total), ({'any', 'unset', 'women', 'open_range'}, 4))
+
+
+class ReplicaRoutingTests(UsersMixin, TransactionTestCase):
+    # druga baza SQLite jako replika; dane trafiają do niej tylko przez sync_sqlite_replica
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings[REPLICA] = dict(connections.settings['default'],
+                                             NAME=os.path.join(cls.replica_dir, 'replica.sqlite3'))
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        call_command('sync_sqlite_replica', stdout=StringIO())
+
+    def sent_subjects(self):
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            response = self.client.get(reverse('app:inbox') + '?sorting=sent')
+        return [message.subject for message in response.context['messages']], bool(replica_queries)
+
+    def test_reads_own_writes_after_post(self):
+        self.assertEqual(self.sent_subjects(), ([], True))
+
+        response = self.client.post(reverse('app:send_message', args=[self.ala.pk]),
+                                    {'subject': 'Cześć', 'body': 'Treść', 'font_family': 'Great Vibes'})
+        self.assertRedirects(response, reverse('app:inbox'))
+        self.assertEqual(self.sent_subjects(), (['Cześć'], False))
+
+        # po czasie przypięcia znowu replika - jeszcze bez nowego listu
+        session = self.client.session
+        session[PIN_SESSION_KEY] = 0
+        session.save()
+        self.assertEqual(self.sent_subjects(), ([], True))
+
+    def test_unread_badge_is_counted_on_primary(self):
+        Message.objects.create(sender=self.ola, receiver=self.ala, subject='Cześć', body='Treść')
+        cache.clear()
+        self.client.force_login(self.ala)
+        response = self.client.get(reverse('app:inbox'))
+        self.assertEqual((response.context['messages'].items, response.context['unread_letters']), ([], 1))
+
+    def test_primary_escape_hatch(self):
+        @replica_reads
+        def view(request):
+            with primary():
+                inside = router.db_for_read(Message)
+            return HttpResponse('%s %s' % (router.db_for_read(Message), inside))
+
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        self.assertEqual(view(request).content, b'replica default')
+
+
+class LetterNotificationTests(UsersTestCase):
+    def send(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Message.objects.create(sender=self.ala, receiver=self.ola, subject='Cześć', body='Treść')
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        return queries
+
+    def test_no_queries_without_subscribers(self):
+        self.assertEqual(len(self.send()), 0)
+
+    def test_subscriber_gets_unread_count(self):
+        with mock.patch.object(get_broker(), 'subscriber_count', return_value=1), \
+                mock.patch.object(get_broker(), 'publish') as publish:
+            self.send()
+        user_id, event = publish.call_args.args
+        self.assertEqual((user_id, event['unread'], event['sender']), (self.ola.pk, 1, 'ala'))
+
+    def test_full_queue_drops_oldest_event(self):
+        queue = asyncio.Queue(2)
+        for event in range(3):
+            InProcessBroker._put(queue, event)
+        self.assertEqual([queue.get_nowait() for _ in range(2)], [1, 2])
+
+    def test_event_stream_only_under_asgi(self):
+        for async_views in (False, True):
+            with self.subTest(async_views=async_views), override_settings(ASYNC_VIEWS=async_views):
+                response = self.client.get(reverse('app:likes'))
+                self.assertEqual(reverse('app:letter_events') in response.content.decode(), async_views)
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.ola = User.objects.create(username='ola', email='ola@example.com')
+        self.ala = User.objects.create(username='ala', email='ala@example.com', first_name='Ala')
+        self.message = Message.objects.create(sender=self.ola, receiver=self.ala,
+                                              subject='Pozdrowienia z Łodzi', body='Piękna pogoda')
+
+    def found(self, query):
+        return list(search_page(Message.objects.all(), query).object_list)
+
+    def test_index_follows_save_and_delete(self):
+        self.assertIsInstance(get_backend(), SQLiteFTSBackend)
+        self.assertEqual(self.found('lodzi'), [self.message])
+        self.assertEqual(self.found('ala pogo'), [self.message])
+
+        self.message.body = 'Deszcz'
+        self.message.save()
+        self.assertEqual(self.found('pogoda'), [])
+        self.assertEqual(self.found('deszcz'), [self.message])
+
+        self.message.delete()
+        self.assertEqual(self.found('deszcz'), [])
+
+
+class BenchmarkHelperTests(SimpleTestCase):
+    def test_threads_merge_timings(self):
+        def target(number, deadline, timings):
+            timings.add('send', number)
+            timings.error('read')
+
+        timings = run_threads(4, 0, target)
+        self.assertEqual((timings.count('send'), timings.errors['read']), (4, 4))
+        self.assertEqual((timings.percentile('send', 50), timings.percentile('send', 99)), (2, 3))
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+class FontTests(SimpleTestCase):
+    def test_icons_used_in_templates_are_in_the_subset(self):
+        directory = os.path.join(os.path.dirname(__file__), 'templates')
+        used = set()
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), encoding='utf-8') as file:
+                used.update(re.findall(r'class="material-icons"[^>]*>\s*(\w+)\s*<', file.read()))
+        self.assertTrue(used)
+        self.assertEqual(used - set(ICONS), set())
+
+    def test_built_fonts_are_self_hosted(self):
+        html = Template("{% load fonts %}{% font_faces 'Lato' %}").render(Context())
+        self.assertIn(static('fonts/lato-700.woff2'), html)
+        self.assertNotIn('fonts.googleapis.com', html)
+
+
+class UnreadCountTests(UsersTestCase):
+    def send(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.ala, receiver=self.ola, subject='Cześć', body='Treść')
+
+    def test_letter_sent_during_rebuild_is_not_lost(self):
+        self.send()
+        cache.clear()
+        count = QuerySet.count
+
+        def count_then_send(queryset):
+            result = count(queryset)
+            self.send()
+            return result
+
+        with mock.patch.object(QuerySet, 'count', count_then_send):
+            unread.get_unread_count(self.ola)
+        self.assertEqual(unread.get_unread_count(self.ola), 2)
+        self.send()
+        self.assertEqual(unread.get_unread_count(self.ola), 3)
+
+
+class ConversationTests(UsersTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ela = User.objects.create(username='ela', email='ela@example.com')
+
+    def send(self, sender, receiver, body='Treść'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(sender=sender, receiver=receiver, subject='Temat', body=body)
+
+    def prime_badge(self, user, count):
+        # wpis bez znacznika odtwarzania - zmiany trafiają do niego przez incr/decr
+        cache.set(unread.cache_key(user.pk), count)
+
+    def badge(self, user):
+        # licznik z cache - bez zapytania do bazy
+        with self.assertNumQueries(0):
+            return unread.get_unread_count(user)
+
+    def test_sending_updates_counters(self):
+        self.prime_badge(self.ola, 0)
+        self.send(self.ala, self.ola, 'Pierwszy')
+        self.send(self.ola, self.ala, 'Odpowiedź')
+        last = self.send(self.ala, self.ola, 'x' * 150)
+
+        conversation = Conversation.objects.get()
+        self.assertEqual((conversation.unread_for(self.ola), conversation.unread_for(self.ala)), (2, 1))
+        self.assertEqual(conversation.last_message_at, last.sent_date)
+        self.assertEqual(conversation.last_message_preview, 'x' * 99 + '…')
+        self.assertEqual(self.badge(self.ola), 2)
+
+        listed = self.client.get(reverse('app:conversation_list')).context['conversations']
+        self.assertEqual([(item.other_user, item.unread) for item in listed], [(self.ala, 2)])
+
+    def test_opening_thread_zeroes_counter_and_badge(self):
+        self.send(self.ala, self.ola)
+        self.send(self.ala, self.ola)
+        self.send(self.ola, self.ala)
+        conversation = Conversation.objects.get()
+        self.prime_badge(self.ola, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('app:conversation', args=[conversation.pk]))
+        self.assertEqual(len(response.context['letters'].items), 3)
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.unread_for(self.ola), conversation.unread_for(self.ala)), (0, 1))
+        self.assertFalse(Message.objects.filter(receiver=self.ola, is_read=False).exists())
+        self.assertEqual(self.badge(self.ola), 0)
+
+        self.client.force_login(self.ela)
+        response = self.client.get(reverse('app:conversation', args=[conversation.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_reading_one_letter_never_goes_below_zero(self):
+        first, second = self.send(self.ala, self.ola), self.send(self.ala, self.ola)
+        self.prime_badge(self.ola, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(first.mark_read())
+        self.assertFalse(first.mark_read())
+        self.assertEqual(Conversation.objects.get().unread_for(self.ola), 1)
+        self.assertEqual(self.badge(self.ola), 1)
+
+        # licznik rozjechany z listami - nie może zejść poniżej zera
+        Conversation.objects.update(unread_a=0, unread_b=0)
+        second.mark_read()
+        self.assertEqual(Conversation.objects.get().unread_for(self.ola), 0)
+
+    def test_batch_operations_recompute_summary(self):
+        from_ala = [self.send(self.ala, self.ola, 'Od Ali %d' % number) for number in range(2)]
+        reply = self.send(self.ola, self.ala, 'Odpowiedź')
+        from_ela = self.send(self.ela, self.ola, 'Od Eli')
+        self.prime_badge(self.ola, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('app:inbox_batch'), {'action': 'read', 'sender': 'ala'})
+        self.assertEqual(Conversation.objects.between(self.ola, self.ala).get().unread_for(self.ola), 0)
+        self.assertEqual(unread.get_unread_count(self.ola), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('app:inbox_batch'), {'action': 'unread', 'ids': [from_ala[0].pk]})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('app:inbox_batch'), {'action': 'delete', 'ids': [from_ala[1].pk, from_ela.pk]})
+
+        conversation = Conversation.objects.get()
+        self.assertEqual((conversation.user_a, conversation.user_b), (self.ola, self.ala))
+        self.assertEqual((conversation.unread_for(self.ola), conversation.unread_for(self.ala)), (1, 1))
+        self.assertEqual((conversation.last_message_at, conversation.last_message_preview),
+                         (reply.sent_date, 'Odpowiedź'))
+        self.assertEqual(unread.get_unread_count(self.ola), 1)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Cofa aplikację do `migrate_from`; `migrate()` przechodzi dalej i zwraca stan modeli."""
+    migrate_from = None
+
+    def setUp(self):
+        self.old_apps = self.migrate(self.migrate_from)
+
+    def tearDown(self):
+        call_command('migrate', 'app', verbosity=0)
+
+    def migrate(self, target):
+        call_command('migrate', 'app', target, verbosity=0)
+        return MigrationExecutor(connection).loader.project_state(('app', target)).apps
+
+
+class ConversationMigrationTests(MigrationTestCase):
+    migrate_from = '0021_userprofile_interests_bitmask'
+
+    def test_conversations_are_backfilled(self):
+        User = self.old_apps.get_model('app', 'User')
+        Message = self.old_apps.get_model('app', 'Message')
+        ola, ala, ela = [User.objects.create(username=name, email='%s@example.com' % name)
+                         for name in ('ola', 'ala', 'ela')]
+        sent = timezone.now()
+        for minutes, sender, receiver, is_read in [(1, ala, ola, False), (2, ola, ala, True),
+                                                   (3, ala, ola, False), (4, ola, ala, False)]:
+            message = Message.objects.create(sender=sender, receiver=receiver, subject='Temat',
+                                             body='List %d' % minutes, is_read=is_read)
+            Message.objects.filter(pk=message.pk).update(sent_date=sent + timedelta(minutes=minutes))
+        Message.objects.create(sender=ela, receiver=ela, subject='Temat', body='Do siebie')
+
+        new_apps = self.migrate('0022_conversation')
+        Conversation = new_apps.get_model('app', 'Conversation')
+        conversation = Conversation.objects.get(user_b_id=ala.pk)
+        self.assertEqual((conversation.user_a_id, conversation.unread_a, conversation.unread_b), (ola.pk, 2, 1))
+        self.assertEqual((conversation.last_message_at, conversation.last_message_preview),
+                         (sent + timedelta(minutes=4), 'List 4'))
+        self.assertEqual(new_apps.get_model('app', 'Message').objects.filter(conversation=conversation).count(), 4)
+        self.assertEqual(Conversation.objects.get(user_a_id=ela.pk).unread_b, 1)
+
+
+class InterestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, interests in [('ola', ['music', 'books']), ('ala', ['music']), ('ela', [])]:
+            user = User.objects.create(username=name, email='%s@example.com' % name)
+            UserProfile.objects.filter(user=user).update(interests=UserProfile.interests_to_mask(interests))
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('user__username', flat=True))
+
+    def test_filters(self):
+        profiles = UserProfile.objects.all()
+        self.assertEqual(self.names(profiles.with_any_interests('books', 'dancing')), ['ola'])
+        self.assertEqual(self.names(profiles.with_any_interests('music', 'nieznane')), ['ala', 'ola'])
+        self.assertEqual(self.names(profiles.with_all_interests('music', 'books')), ['ola'])
+        self.assertEqual(self.names(profiles.with_all_interests('music')), ['ala', 'ola'])
+        self.assertEqual(self.names(profiles.with_any_interests()), [])
+
+    def test_form_round_trip(self):
+        profile = UserProfile.objects.get(user__username='ela')
+        data = {'country': 'PL', 'sex_preference': 'A', 'interests': ['tennis', 'books']}
+        form = UserProfileForm(data, instance=profile)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.interests, UserProfile.interests_to_mask(['books', 'tennis']))
+        self.assertEqual(UserProfileForm(instance=profile).initial['interests'], ['books', 'tennis'])
+        self.assertEqual(profile.get_interests_display(), 'Książki, Tenis')
+
+        self.assertFalse(UserProfileForm(dict(data, interests=['nieznane']), instance=profile).is_valid())
+
+
+class RefreshAgesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.invalidated = []
+
+    def profile(self, name, date_of_birth, age):
+        user = User.objects.create(username=name, email='%s@example.com' % name)
+        UserProfile.objects.filter(user=user).update(date_of_birth=date_of_birth, age=age)
+        return user
+
+    def refresh(self, today, *args):
+        class Today(date):
+            @classmethod
+            def today(cls):
+                return today
+
+        def invalidate(*user_ids):
+            # wiek odczytany w chwili unieważnienia - musi już być nowy
+            self.invalidated.append(dict(UserProfile.objects.filter(user_id__in=user_ids)
+                                         .values_list('user__username', 'age')))
+
+        with mock.patch('app.management.commands.refresh_ages.date', Today), \
+                mock.patch('app.fragments.invalidate', invalidate):
+            call_command('refresh_ages', *args, stdout=StringIO())
+        return dict(UserProfile.objects.exclude(date_of_birth=None).values_list('user__username', 'age'))
+
+    def test_birthday_today(self):
+        self.profile('ola', date(2000, 5, 5), 25)
+        self.profile('ala', date(2000, 5, 6), 25)
+        self.assertEqual(self.refresh(date(2026, 5, 5)), {'ola': 26, 'ala': 25})
+        self.assertEqual(self.invalidated, [{'ola': 26}])
+
+    def test_leap_day_birthday_on_first_of_march(self):
+        self.profile('ola', date(2004, 2, 29), 22)
+        self.assertEqual(self.refresh(date(2028, 3, 1)), {'ola': 22})
+        self.assertEqual(self.refresh(date(2027, 3, 1)), {'ola': 23})
+
+    def test_all_in_batches(self):
+        for number in range(5):
+            self.profile('user%d' % number, date(1990 + number, 1, 1), 0)
+        self.profile('ola', date(2000, 12, 31), 25)
+        self.profile('ala', None, None)
+
+        ages = self.refresh(date(2026, 6, 1), '--all', '--batch-size', '2')
+        self.assertEqual(ages, dict({'user%d' % number: 36 - number for number in range(5)}, ola=25))
+        self.assertEqual([len(batch) for batch in self.invalidated], [2, 2, 1])
+
+
+class InterestsMigrationTests(MigrationTestCase):
+    migrate_from = '0020_userprofile_match_fields'
+
+    def test_interests_become_bits_and_back(self):
+        OldUser = self.old_apps.get_model('app', 'User')
+        OldProfile = self.old_apps.get_model('app', 'UserProfile')
+        for name, interests in [('ola', "['music', 'books', 'nieznane']"), ('ala', '')]:
+            user = OldUser.objects.create(username=name, email='%s@example.com' % name)
+            OldProfile.objects.create(user=user, interests=interests)
+
+        new_apps = self.migrate('0021_userprofile_interests_bitmask')
+        flags = dict(new_apps.get_model('app', 'UserProfile').objects.values_list('user__username', 'interests'))
+        self.assertEqual(flags, {'ola': UserProfile.interests_to_mask(['music', 'books']), 'ala': 0})
+
+        old_apps = self.migrate(self.migrate_from)
+        interests = dict(old_apps.get_model('app', 'UserProfile').objects.values_list('user__username', 'interests'))
+        self.assertEqual(interests, {'ola': "['music', 'books']", 'ala': ''})
+
+
+class PasswordRehashTests(TestCase):
+    def login(self):
+        return self.client.post(reverse('app:login'), {'username': 'ola@example.com', 'password': 'Trudne-haslo-123'})
+
+    def test_login_upgrades_stored_hash(self):
+        user = User.objects.create(username='ola', email='ola@example.com',
+                                   password=make_password('Trudne-haslo-123', hasher='pbkdf2_sha256'))
+
+        self.assertRedirects(self.login(), reverse('app:index'), fetch_redirect_response=False)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$16384$'))
+
+        with override_settings(PASSWORD_SCRYPT={'work_factor': 2 ** 12}):
+            self.client.logout()
+            self.login()
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$4096$'))
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        get_store().clear()
+
+    def test_login_attempts_are_limited_per_email_and_address(self):
+        data = {'username': 'Ola@example.com', 'password': 'zle-haslo'}
+        for attempt in range(5):
+            self.assertEqual(self.client.post(reverse('app:login'), data).status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('app:login'), dict(data, username='ola@example.com'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(len(queries), 0)
+
+        other_address = self.client.post(reverse('app:login'), data, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(other_address.status_code, 200)
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_ip_behind_trusted_proxy(self):
+        factory = RequestFactory()
+        forwarded = factory.post('/', REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='1.2.3.4, 198.51.100.1, 10.0.0.3')
+        self.assertEqual(client_ip(forwarded), '198.51.100.1')
+        direct = factory.post('/', REMOTE_ADDR='198.51.100.9', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(client_ip(direct), '198.51.100.9')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        ola = User.objects.create(username='ola', email='ola@example.com')
+        ala = User.objects.create(username='ala', email='ala@example.com')
+        now = timezone.now()
+        # kilka listów z tą samą datą - kolejność rozstrzyga id
+        for minutes in (3, 2, 1, 1, 0, 0, 0):
+            message = Message.objects.create(sender=ala, receiver=ola, subject='Temat', body='Treść')
+            Message.objects.filter(pk=message.pk).update(sent_date=now - timedelta(minutes=minutes))
+        self.letters = Message.objects.order_by('-sent_date', '-id')
+
+    def page(self, **cursor):
+        return keyset_page(self.letters, per_page=3, **cursor)
+
+    def test_older_and_newer_pages_round_trip(self):
+        pages = [self.page()]
+        while pages[-1].older_cursor:
+            pages.append(self.page(older=pages[-1].older_cursor))
+        self.assertEqual([item for page in pages for item in page], list(self.letters))
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0].newer_cursor)
+
+        for older, newer in zip(pages[1:], pages):
+            back = self.page(newer=older.newer_cursor)
+            self.assertEqual(back.items, newer.items)
+            # strona pobrana "w stronę nowszych" wciąż prowadzi do starszych
+            self.assertEqual(back.older_cursor, newer.older_cursor)
+        self.assertIsNone(self.page(newer=pages[1].newer_cursor).newer_cursor)
+
+    def test_invalid_cursor_shows_first_page(self):
+        first = self.page()
+        for cursor in ('nie-kursor', 'ą', base64.urlsafe_b64encode(b'2020-01-01|x').decode()):
+            with self.subTest(cursor):
+                self.assertEqual(self.page(older=cursor).items, first.items)
+                self.assertEqual(self.page(newer=cursor).items, first.items)
+
+    def test_async_pages_match(self):
+        first = async_to_sync(akeyset_page)(self.letters, per_page=3)
+        second = async_to_sync(akeyset_page)(self.letters, older=first.older_cursor, per_page=3)
+        self.assertEqual((first.items, second.items),
+                         (self.page().items, self.page(older=self.page().older_cursor).items))
+
+
+class InboxBatchTests(UsersTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ela = User.objects.create(username='ela', email='ela@example.com')
+        self.from_ala = [Message.objects.create(sender=self.ala, receiver=self.ola, subject='A', body='a')
+                         for _ in range(2)]
+        self.from_ela = Message.objects.create(sender=self.ela, receiver=self.ola, subject='E', body='e')
+        self.sent = Message.objects.create(sender=self.ola, receiver=self.ala, subject='S', body='s')
+
+    def batch(self, **data):
+        return self.client.post(reverse('app:inbox_batch'), data)
+
+    def test_invalid_older_than_days_deletes_nothing(self):
+        for value in ('abc', '-1', '7.5'):
+            with self.subTest(value):
+                self.batch(action='delete', older_than_days=value)
+                self.assertEqual(Message.objects.count(), 4)
+
+    def test_action_without_selection_is_rejected(self):
+        self.batch(action='read')
+        self.batch(action='delete', only_read='1')
+        self.assertEqual(Message.objects.filter(is_read=True).count(), 0)
+        self.assertEqual(Message.objects.count(), 4)
+
+    def test_only_read_limits_deletion(self):
+        self.from_ala[0].mark_read()
+        self.batch(action='delete', only_read='1', older_than_days='0')
+        self.assertQuerysetEqual(Message.objects.filter(receiver=self.ola).order_by('id'),
+                                 [self.from_ala[1], self.from_ela])
+
+    def test_ids_and_sender_are_scoped_to_own_inbox(self):
+        self.batch(action='delete', ids=[self.from_ala[0].pk, self.sent.pk])
+        self.assertFalse(Message.objects.filter(pk=self.from_ala[0].pk).exists())
+        self.assertTrue(Message.objects.filter(pk=self.sent.pk).exists())
+
+        self.batch(action='read', sender='ala')
+        self.assertTrue(Message.objects.get(pk=self.from_ala[1].pk).is_read)
+        self.assertFalse(Message.objects.get(pk=self.from_ela.pk).is_read)
+        self.assertFalse(Message.objects.get(pk=self.sent.pk).is_read)
+
+
+class TaskQueueTests(TestCase):
+    def test_failed_and_abandoned_jobs_are_scheduled_again(self):
+        tasks.enqueue('delete_profile_picture')  # brak argumentu - zadanie się nie powiedzie
+        self.assertEqual(tasks.run_pending(), 1)
+
+        job = Task.objects.get()
+        self.assertEqual((job.status, job.attempts), (Task.PENDING, 1))
+        self.assertEqual(tasks.next_run_at(), job.run_after)
+        self.assertGreater(job.run_after, timezone.now())
+
+        Task.objects.update(status=Task.RUNNING, locked_at=timezone.now() - tasks.STALE_AFTER * 2)
+        self.assertLess(tasks.next_run_at(), timezone.now())
+        self.assertEqual(tasks.requeue_stale(), 1)
+
+
+def phone_photo(orientation=6):
+    # 40x20 px zapisane "na boku" - telefon każe je obrócić znacznikiem Orientation
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x8825] = {2: (50.0, 3.0, 0.0)}  # GPS
+    buffer = BytesIO()
+    Image.new('RGB', (40, 20), 'red').save(buffer, format='JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = ProfilePictureStorage(location=self.location)
+
+    def open_image(self, name):
+        with self.storage.open(name) as file:
+            image = Image.open(file)
+            image.load()
+        return image
+
+    def test_upload_is_cleaned_before_it_gets_its_address(self):
+        name = self.storage.save('profile_pics/photo.jpg', ContentFile(phone_photo()))
+        with self.storage.open(name) as file:
+            self.assertIn(hashlib.sha256(file.read()).hexdigest(), name)
+
+        original = self.open_image(name)
+        self.assertNotIn('exif', original.info)
+        self.assertEqual(original.size, (20, 40))
+
+        generate_renditions(name, self.storage)
+        self.assertEqual(self.open_image(rendition_name(name, 'thumb')).size, (230, 400))
+        with self.storage.open(name) as file:
+            self.assertIn(hashlib.sha256(file.read()).hexdigest(), name)
+
+    def test_reupload_protects_file_from_deletion(self):
+        name = self.storage.save('profile_pics/photo.jpg', ContentFile(phone_photo()))
+        generate_renditions(name, self.storage)
+        os.utime(self.storage.path(name), (0, 0))
+
+        self.assertEqual(self.storage.save('profile_pics/again.jpg', ContentFile(phone_photo())), name)
+        with mock.patch('app.tasks.profile_pic_storage', self.storage):
+            tasks.delete_profile_picture(name)
+            self.assertTrue(self.storage.exists(name))
+
+            os.utime(self.storage.path(name), (0, 0))
+            user = User.objects.create(username='ola', email='ola@example.com')
+            UserProfile.objects.filter(user=user).update(profile_pic=name)
+            tasks.delete_profile_picture(name)
+            self.assertTrue(self.storage.exists(name))
+
+            UserProfile.objects.filter(user=user).update(profile_pic='profile_pics/default.png')
+            tasks.delete_profile_picture(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(self.storage.exists(rendition_name(name, 'thumb')))
+
+    def test_sweep_keeps_referenced_pictures_and_their_renditions(self):
+        kept = self.storage.save('profile_pics/photo.jpg', ContentFile(phone_photo()))
+        removed = self.storage.save('profile_pics/other.jpg', ContentFile(phone_photo(orientation=1)))
+        for name in (kept, removed):
+            generate_renditions(name, self.storage)
+        user = User.objects.create(username='ola', email='ola@example.com')
+        UserProfile.objects.filter(user=user).update(profile_pic=kept)
+
+        with mock.patch('app.tasks.profile_pic_storage', self.storage):
+            self.assertEqual(tasks.sweep_profile_pictures(min_age_seconds=-60), 1 + len(rendition_names(removed)))
+        self.assertTrue(self.storage.exists(kept) and self.storage.exists(rendition_name(kept, 'thumb')))
+        self.assertFalse(self.storage.exists(removed) or self.storage.exists(rendition_name(removed, 'thumb')))
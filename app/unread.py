@@ -0,0 +1,70 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import primary
+
+
+# Licznik nieprzeczytanych listów trzymany w cache - pasek nawigacji nie
+# odpytuje bazy przy każdym wyświetleniu strony. Przy braku wpisu licznik
+# jest odtwarzany jednym COUNT(*).
+#
+# Zmiana skrzynki w trakcie odtwarzania (po COUNT, przed zapisem wyniku) nie
+# miałaby czego zwiększyć, a wynik COUNT by ją pominął. Dlatego odtwarzanie
+# zostawia na chwilę znacznik; zmiana, która go zastanie, oznacza go jako
+# nieaktualny i usuwa licznik, a odtworzony wynik nie zostaje w cache.
+
+CACHE_TIMEOUT = 60 * 60 * 24
+REBUILD_TIMEOUT = 10
+
+
+def cache_key(user_id):
+    return 'unread-letters:%d' % user_id
+
+
+def rebuild_key(user_id):
+    return 'unread-letters-rebuild:%d' % user_id
+
+
+def get_unread_count(user):
+    count = cache.get(cache_key(user.pk))
+    if count is None:
+        from .models import Message
+        cache.add(rebuild_key(user.pk), 'clean', REBUILD_TIMEOUT)
+        # z bazy głównej - licznik z opóźnionej repliki zostałby w cache na całą dobę
+        with primary():
+            count = Message.objects.filter(receiver=user, is_read=False).count()
+        # add - nie nadpisuje licznika odtworzonego w międzyczasie przez inne żądanie
+        if not cache.add(cache_key(user.pk), count, CACHE_TIMEOUT):
+            count = cache.get(cache_key(user.pk), count)
+        if cache.get(rebuild_key(user.pk)) == 'dirty':
+            cache.delete(cache_key(user.pk))
+    return count
+
+
+def _forget(user_id):
+    if cache.get(rebuild_key(user_id)) is not None:
+        cache.set(rebuild_key(user_id), 'dirty', REBUILD_TIMEOUT)
+    cache.delete(cache_key(user_id))
+
+
+def _add(user_id, delta):
+    if cache.get(rebuild_key(user_id)) is not None:
+        _forget(user_id)  # trwa odtwarzanie - jego COUNT mógł tę zmianę pominąć
+        return
+    try:
+        if cache.incr(cache_key(user_id), delta) < 0:
+            cache.delete(cache_key(user_id))
+    except ValueError:
+        pass  # brak wpisu - zostanie odtworzony przy następnym odczycie
+
+
+def increment(user_id, delta=1):
+    transaction.on_commit(lambda: _add(user_id, delta))
+
+
+def decrement(user_id, delta=1):
+    transaction.on_commit(lambda: _add(user_id, -delta))
+
+
+def invalidate(user_id):
+    transaction.on_commit(lambda: _forget(user_id))
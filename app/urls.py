@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 from django.views.generic.base import RedirectView
 from django.templatetags.static import static
 
 app_name = 'app'
+
+# pod ASGI przeglądanie profili i listy obsługują widoki asynchroniczne
+browsing = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('favicon.ico', RedirectView.as_view(url=static('favicon.ico'))),
@@ -14,11 +19,17 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('profile/profile_settings', views.profile_settings, name='profile_settings'),
     path('profile/account_settings', views.account_settings, name='account_settings'),
-    path('profile_list/', views.profile_list, name='profile_list'),
-    path('user_profile/<int:user_id>/', views.user_profile, name='user_profile'),
+    path('profile_list/', browsing.profile_list, name='profile_list'),
+    path('user_profile/<int:user_id>/', browsing.user_profile, name='user_profile'),
+    path('user_profile/<int:user_id>/like', views.like_profile, name='like_profile'),
+    path('likes/', views.likes, name='likes'),
 
-    path('send_message/<int:receiver_id>/', views.send_message, name='send_message'),
-    path('inbox/', views.inbox, name='inbox'),
-    path('inbox/view_message/<int:message_id>/', views.view_message, name='view_message'),
+    path('send_message/<int:receiver_id>/', browsing.send_message, name='send_message'),
+    path('inbox/', browsing.inbox, name='inbox'),
+    path('inbox/batch/', views.inbox_batch, name='inbox_batch'),
+    path('inbox/view_message/<int:message_id>/', browsing.view_message, name='view_message'),
     path('inbox/view_message/<int:message_id>/send_reply', views.send_reply, name='send_reply'),
+    path('conversations/', views.conversation_list, name='conversation_list'),
+    path('conversations/<int:conversation_id>/', views.conversation_detail, name='conversation'),
+    path('events/letters/', async_views.letter_events, name='letter_events'),
 ]
@@ -1,14 +1,28 @@
-from django.db.models import Q, Max
+from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, logout, authenticate
+from django.template.loader import render_to_string
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
+from django.views.static import serve
 from django.contrib.auth.views import PasswordResetView
 from django.contrib.messages.views import SuccessMessageMixin
 from django.urls import reverse
 from django.contrib import messages
+from django.core.paginator import Paginator
+from . import fragments
 from .forms import RegisterForm, UserProfileForm, LoginForm, MessageForm
-from .models import UserProfile, Message, User
+from .models import UserProfile, Message, User, Conversation
+from .matching import cached_ranking, ranking_depth
+from .pagination import keyset_page
+from .ratelimit import ratelimit
+from .routers import replica_reads
+from .search import search_page
+from .storage import profile_pic_storage
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
 from datetime import date, timedelta
 
 
@@ -16,20 +30,25 @@ def index(request):
     return render(request, 'home.html')
 
 
+def serve_media(request, path, document_root=None):
+    # serwowanie plików z MEDIA_ROOT w trybie DEBUG; w produkcji te same nagłówki
+    # powinien ustawiać serwer WWW dla ścieżek z profile_pics/xx/<sha256>
+    response = serve(request, path, document_root=document_root)
+    if profile_pic_storage.is_content_addressed(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 ################### LOGOWANIE / REJESTRACJA #####################################################
 
+@ratelimit('login', email_field='username')
 def login_request(request):
     if request.method == 'POST':
         form = LoginForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(request, username=username, password=password)
-            if user is not None:
-                login(request, user)
-                return redirect('app:index')
-            else:
-                messages.error(request, 'Niepoprawny login lub hasło.')
+            # AuthenticationForm uwierzytelnił już użytkownika w is_valid()
+            login(request, form.get_user())
+            return redirect('app:index')
         else:
             messages.error(request, 'Niepoprawny login lub hasło.')
     else:
@@ -44,15 +63,13 @@ def logout_request(request):
     return redirect(reverse('app:index'))
 
 
+@ratelimit('register')
 def register_request(request):
     if request.method == 'POST':
         user_form = RegisterForm(request.POST)
         if user_form.is_valid():
-            user_form.save()
-            email = user_form.cleaned_data['email']
-            password = user_form.cleaned_data['password1']
-            authenticated_user = authenticate(email=email, password=password)
-            login(request, authenticated_user)
+            user = user_form.save()
+            login(request, user)
 
             return redirect('app:profile')
         else:
@@ -67,8 +84,10 @@ def register_request(request):
 
 @login_required
 def profile(request):
-    profile = UserProfile.objects.get(user=request.user)
-    return render(request, 'profile.html')
+    user = request.user
+    detail = fragments.cached_fragments('own_profile', [user.pk], lambda user_ids: {
+        user.pk: render_to_string('profile_detail.html', {'user': user})})[user.pk]
+    return render(request, 'profile.html', {'detail': detail})
 
 
 @login_required
@@ -101,6 +120,7 @@ def account_settings(request):
     return render(request, 'account_settings.html', {'user_form': user_form})
 
 
+@method_decorator(ratelimit('password_reset'), name='dispatch')
 class ResetPasswordView(SuccessMessageMixin, PasswordResetView):
     template_name = 'password_reset.html'
     email_template_name = 'users/password_reset_email.html'
@@ -115,47 +135,40 @@ class ResetPasswordView(SuccessMessageMixin, PasswordResetView):
 ################## OTHER PROFILES #####################################################
 
 @login_required
+@replica_reads
 def profile_list(request):
     profiles = request.user.userprofile
+    filtered_profiles = _filter_profiles(request, profiles)
+
+    page_number = request.GET.get('page')
+    ranking = cached_ranking(profiles, filtered_profiles, ranking_depth(page_number, 24))
+    page = Paginator(ranking, 24).get_page(page_number)
+    user_ids = dict(UserProfile.objects.filter(pk__in=page.object_list).values_list('pk', 'user_id'))
+    cards = fragments.cached_fragments('profile_card', list(user_ids.values()), _render_profile_cards)
+    liked = set(_liked_user_ids(request.user, user_ids.values()))
+
+    return render(request, 'profile_list.html', _profile_list_context(request, page, user_ids, cards, liked))
+
+
+def _filter_profiles(request, profiles):
     name = request.GET.get('name')
     username = request.GET.get('username')
-    followed_users = request.GET.get('followed')
+    interests = request.GET.getlist('interest')
 
     min_age_preference = profiles.min_age_preference
     max_age_preference = profiles.max_age_preference
     sex_preference = profiles.sex_preference
 
-    if sex_preference == 'A':
-        if min_age_preference and max_age_preference:
-            today = date.today()
-            min_birth_date = today - timedelta(days=max_age_preference * 365)
-            max_birth_date = today - timedelta(days=min_age_preference * 365)
-            filtered_profiles = UserProfile.objects.filter(
-                user__date_of_birth__range=(min_birth_date, max_birth_date)
-            ).exclude(
-                user=request.user
-            )
-        else:
-            filtered_profiles = UserProfile.objects.exclude(
-                user=request.user
-            )
-    else:
-        if min_age_preference and max_age_preference:
-            today = date.today()
-            min_birth_date = today - timedelta(days=max_age_preference * 365)
-            max_birth_date = today - timedelta(days=min_age_preference * 365)
-            filtered_profiles = UserProfile.objects.filter(
-                user__date_of_birth__range=(min_birth_date, max_birth_date),
-                user__sex=sex_preference
-            ).exclude(
-                user=request.user
-            )
-        else:
-            filtered_profiles = UserProfile.objects.filter(
-                user__sex=sex_preference
-            ).exclude(
-                user=request.user
-            )
+    filtered_profiles = UserProfile.objects.exclude(user_id=profiles.user_id)
+
+    if sex_preference and sex_preference != 'A':
+        filtered_profiles = filtered_profiles.filter(sex=sex_preference)
+
+    if min_age_preference and max_age_preference:
+        today = date.today()
+        min_birth_date = today - timedelta(days=max_age_preference * 365)
+        max_birth_date = today - timedelta(days=min_age_preference * 365)
+        filtered_profiles = filtered_profiles.filter(date_of_birth__range=(min_birth_date, max_birth_date))
 
     if name:
         filtered_profiles = filtered_profiles.filter(user__first_name__icontains=name)
@@ -163,59 +176,169 @@ def profile_list(request):
     if username:
         filtered_profiles = filtered_profiles.filter(user__username__icontains=username)
 
-    return render(request, 'profile_list.html', {'profiles': filtered_profiles})
+    if interests:
+        filtered_profiles = filtered_profiles.with_any_interests(*interests)
+
+    return filtered_profiles
+
+
+def _profile_list_context(request, page, user_ids, cards, liked):
+    # stan serduszka zależy od oglądającego, więc nie jest częścią fragmentu z cache
+    return {'profiles': page,
+            'cards': [(user_ids[pk], cards[user_ids[pk]], user_ids[pk] in liked)
+                      for pk in page.object_list if pk in user_ids],
+            'interest_choices': UserProfile.INTEREST_CHOICES,
+            'selected_interests': request.GET.getlist('interest')}
+
 
 @login_required
+@replica_reads
 def user_profile(request, user_id):
-    profile = get_object_or_404(User, id=user_id)
+    detail = fragments.cached_fragments('profile_detail', [user_id], _render_profile_details).get(user_id)
+    if detail is None:
+        raise Http404
+
+    liked = _liked_user_ids(request.user, [user_id]).exists()
+    return render(request, 'user_profile.html', {'detail': detail, 'profile_user_id': user_id, 'liked': liked})
+
+
+def _liked_user_ids(user, user_ids):
+    return UserProfile.objects.liked_by(user).filter(user_id__in=user_ids).values_list('user_id', flat=True)
+
 
-    return render(request, 'user_profile.html', {'profile': profile})
+def _render_profile_cards(user_ids):
+    profiles = UserProfile.objects.for_cards().filter(user_id__in=user_ids)
+    return {profile.user_id: render_to_string('profile_card.html', {'profile': profile}) for profile in profiles}
+
+
+def _render_profile_details(user_ids):
+    users = User.objects.for_profile_details().filter(pk__in=user_ids)
+    return {user.pk: render_to_string('user_profile_detail.html', {'profile': user}) for user in users}
+
+
+################## POLUBIENIA #####################################################
+
+LIKE_LISTS = ('received', 'mutual')
+
+
+@login_required
+@require_POST
+def like_profile(request, user_id):
+    profile = get_object_or_404(UserProfile.objects.only('id', 'user_id'), user_id=user_id)
+    if profile.user_id != request.user.pk:
+        # jawny stan zamiast przełącznika - ponowne wysłanie formularza niczego nie psuje
+        profile.set_liked(request.user, request.POST.get('liked') != '0')
+
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()},
+                                           require_https=request.is_secure()):
+        next_url = reverse('app:user_profile', args=[user_id])
+    return redirect(next_url)
+
+
+@login_required
+@replica_reads
+def likes(request):
+    option = request.GET.get('show')
+    if option not in LIKE_LISTS:
+        option = LIKE_LISTS[0]
+
+    page = Paginator(_liker_ids(request.user, option), 24).get_page(request.GET.get('page'))
+    user_ids = list(page.object_list)
+    cards = fragments.cached_fragments('profile_card', user_ids, _render_profile_cards)
+    liked = set(user_ids) if option == 'mutual' else set(_liked_user_ids(request.user, user_ids))
+
+    return render(request, 'likes.html', {
+        'likers': page,
+        'cards': [(user_id, cards[user_id], user_id in liked) for user_id in user_ids if user_id in cards],
+        'option': option,
+    })
+
+
+def _liker_ids(user, option):
+    # id użytkowników, którzy polubili profil `user` - najnowsze polubienia najpierw
+    likes = UserProfile.followers.through.objects.filter(userprofile__user=user)
+    if option == 'mutual':
+        likes = likes.filter(user__userprofile__followers=user)
+    return likes.order_by('-id').values_list('user_id', flat=True)
 
 
 ############################ WIADOMOŚĆI #####################################################################
 
 
 @login_required
+@replica_reads
 def inbox(request):
     user = request.user
     sorting_options = request.GET.get('sorting', 'received')
     search_query = request.GET.get('q')
 
-    messages = Message.objects.none()
-
-    if 'received' in sorting_options:
-        messages |= Message.objects.filter(receiver=user).order_by('-sent_date')
-    if 'sent' in sorting_options:
-        messages |= Message.objects.filter(sender=user).order_by('-sent_date')
-    if 'read' in sorting_options:
-        messages |= Message.objects.filter(receiver=user, is_read=True).order_by('-sent_date')
-    if 'unread' in sorting_options:
-        messages |= Message.objects.filter(receiver=user, is_read=False).order_by('-sent_date')
-    if 'all' in sorting_options:
-        messages = Message.objects.filter(sender=user) | Message.objects.filter(receiver=user).order_by('-sent_date')
+    messages = Message.objects.mailbox(user, sorting_options)
 
     if search_query:
-        messages = messages.filter(
-            Q(subject__icontains=search_query) |
-            Q(body__icontains=search_query) |
-            Q(receiver__first_name__icontains=search_query) |
-            Q(receiver__username__icontains=search_query)
-        )
+        page = search_page(messages, search_query, request.GET.get('page'))
+    else:
+        page = keyset_page(messages, older=request.GET.get('older'), newer=request.GET.get('newer'))
 
     context = {
-        'messages': messages,
+        'messages': page,
         'sorting_option': sorting_options,
         'search_query': search_query,
     }
 
     return render(request, 'inbox.html', context)
 
+@login_required
+@require_POST
+def inbox_batch(request):
+    action = request.POST.get('action')
+    letters = Message.objects.filter(receiver=request.user)
+    # operacja musi dotyczyć wybranych listów - bez zastosowanego filtra nie ruszamy całej skrzynki
+    scoped = False
+
+    ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+    sender = request.POST.get('sender')
+    older_than_days = request.POST.get('older_than_days', '').strip()
+
+    if older_than_days:
+        try:
+            days = int(older_than_days)
+        except ValueError:
+            days = -1
+        if days < 0:
+            messages.error(request, 'Niepoprawna liczba dni.')
+            return redirect('app:inbox')
+        # ponad 100 lat to i tak cała skrzynka, a większe wartości przepełniają datę
+        letters = letters.filter(sent_date__lt=timezone.now() - timedelta(days=min(days, 36500)))
+        scoped = True
+    if ids:
+        letters = letters.filter(id__in=ids)
+        scoped = True
+    if sender:
+        letters = letters.filter(sender__username=sender)
+        scoped = True
+    if request.POST.get('only_read'):
+        letters = letters.filter(is_read=True)
+
+    if not scoped or action not in ('read', 'unread', 'delete'):
+        messages.error(request, 'Nie wybrano listów.')
+    elif action == 'read':
+        count = letters.mark_read()
+        messages.success(request, 'Oznaczono jako przeczytane: %d.' % count)
+    elif action == 'unread':
+        count = letters.mark_unread()
+        messages.success(request, 'Oznaczono jako nieprzeczytane: %d.' % count)
+    else:
+        count = letters.batch_delete()
+        messages.success(request, 'Usunięto listy: %d.' % count)
+
+    return redirect('app:inbox')
+
+
 @login_required
 def view_message(request, message_id):
-    message = get_object_or_404(Message, id=message_id, receiver=request.user)
-    if not message.is_read:
-        message.is_read = True
-        message.save()
+    message = get_object_or_404(Message.objects.select_related('sender'), id=message_id, receiver=request.user)
+    message.mark_read()
     return render(request, 'view_message.html', {'message': message})
 
 
@@ -233,7 +356,8 @@ def send_message(request, receiver_id):
             return redirect('app:inbox')
     else:
         form = MessageForm()
-    return render(request, 'send_message.html', {'form': form, 'receiver': receiver})
+    conversation = Conversation.objects.between(request.user, receiver).first()
+    return render(request, 'send_message.html', {'form': form, 'receiver': receiver, 'conversation': conversation})
 
 
 @login_required
@@ -250,4 +374,32 @@ def send_reply(request, message_id):
                                          subject=subject, body=body, font_size=font_size, font_family=font_family, picture=picture)
         return redirect('app:inbox')
 
-    return render(request, 'send_reply.html', {'original_message': original_message})
\ No newline at end of file
+    return render(request, 'send_reply.html', {'original_message': original_message})
+
+
+############################ ROZMOWY #####################################################################
+
+
+@login_required
+def conversation_list(request):
+    conversations = Paginator(Conversation.objects.for_user(request.user), 20).get_page(request.GET.get('page'))
+    for conversation in conversations:
+        conversation.other_user = conversation.other(request.user)
+        conversation.unread = conversation.unread_for(request.user)
+    return render(request, 'conversation_list.html', {'conversations': conversations})
+
+
+@login_required
+def conversation_detail(request, conversation_id):
+    conversation = get_object_or_404(Conversation.objects.for_user(request.user), id=conversation_id)
+    if conversation.unread_for(request.user):
+        conversation.mark_read(request.user)
+
+    letters = conversation.messages.select_related('sender', 'receiver').order_by('-sent_date', '-id')
+    page = keyset_page(letters, older=request.GET.get('older'), newer=request.GET.get('newer'))
+
+    return render(request, 'conversation.html', {
+        'conversation': conversation,
+        'other_user': conversation.other(request.user),
+        'letters': page,
+    })
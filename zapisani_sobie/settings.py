@@ -29,9 +29,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.routers.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
 ]
 
 ROOT_URLCONF = 'zapisani_sobie.urls'
@@ -47,6 +47,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.context_processors.unread_letters',
+                'app.context_processors.letter_events',
             ],
         },
     },
@@ -55,15 +57,85 @@ TEMPLATES = [
 WSGI_APPLICATION = 'zapisani_sobie.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_PROFILE=sqlite (domyślnie) albo postgres (parametry w zmiennych POSTGRES_*).
+# Porównanie: `python manage.py benchmark_database`.
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'sqlite')
+
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'zapisani_sobie'),
+            'USER': os.getenv('POSTGRES_USER', 'zapisani_sobie'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # połączenia trzymane między żądaniami (przy wielu workerach - pgbouncer
+            # w trybie transaction przed bazą) i sprawdzane przed ponownym użyciem
+            'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'app.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {'timeout': 20},  # ile sekund czekać na zwolnienie blokady zapisu
+        }
     }
+
+# Replika do odczytu dla przeglądania profili i skrzynki (app/routers.py):
+# DATABASE_REPLICA = ścieżka pliku SQLite (lokalnie: `manage.py sync_sqlite_replica`)
+# albo nazwa bazy Postgresa (na hoście POSTGRES_REPLICA_HOST).
+if os.getenv('DATABASE_REPLICA'):
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=os.getenv('DATABASE_REPLICA'),
+                                TEST={'MIRROR': 'default'})
+    if DATABASE_PROFILE == 'postgres':
+        DATABASES['replica']['HOST'] = os.getenv('POSTGRES_REPLICA_HOST', DATABASES['default']['HOST'])
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+# jak długo po zapisie sesja czyta z bazy głównej (opóźnienie repliki)
+REPLICA_PIN_SECONDS = 10
+
+# PRAGMY ustawiane na każdym połączeniu SQLite (app/database.py): WAL pozwala czytać
+# w trakcie zapisu, a synchronous=NORMAL w trybie WAL nie grozi uszkodzeniem bazy.
+# SQLITE_TUNING=0 - domyślne ustawienia SQLite (do porównań).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # 32 MB
+    'temp_store': 'MEMORY',
+} if os.getenv('SQLITE_TUNING', '1') == '1' else {}
+
+# Cache: fragmenty profili (app.fragments), licznik nieprzeczytanych listów.
+# Pamięć procesu wystarcza przy jednym procesie; przy kilku procesach WSGI
+# CACHE_BACKEND=file albo CACHE_BACKEND=db (wymaga `manage.py createcachetable`).
+CACHE_BACKENDS = {
+    'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10000}},
+    'file': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+             'LOCATION': os.path.join(BASE_DIR, 'cache')},
+    'db': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'app_cache'},
 }
+CACHES = {'default': CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem')]}
 
 
 AUTH_USER_MODEL = 'app.User'
+# zalogowany użytkownik czytany z cache zamiast z bazy przy każdym żądaniu (app/authentication.py)
+AUTHENTICATION_BACKENDS = ['app.authentication.CachedModelBackend']
+# Hasła: scrypt z kosztem dobranym do sprzętu (`python manage.py tune_password_hasher`),
+# starsze hashe PBKDF2 są przeliczane przy najbliższym logowaniu (app/hashers.py)
+PASSWORD_HASHERS = [
+    'app.hashers.TunedScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+PASSWORD_SCRYPT = {
+    'work_factor': int(os.getenv('SCRYPT_WORK_FACTOR', 2 ** 14)),
+    'block_size': int(os.getenv('SCRYPT_BLOCK_SIZE', 8)),
+    'parallelism': int(os.getenv('SCRYPT_PARALLELISM', 1)),
+}
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -90,6 +162,16 @@ USE_TZ = True
 
 STATIC_URL = '/20_wroblewska/zapisani_sobie/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'app/static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Poza DEBUG pliki statyczne mają nazwy z hashem zawartości (można je cache'ować
+# "na zawsze"), przepakowane obrazki z wariantami AVIF/WebP i kopie .gz/.br -
+# wymaga `python manage.py collectstatic`.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'app.storage.OptimizedStaticFilesStorage'},
+}
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/20_wroblewska/zapisani_sobie/media/'
@@ -101,6 +183,42 @@ LOGIN_URL = 'login'
 
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 30
 
+# Sesje: cached_db czyta sesję z cache (zapisy nadal trafiają do bazy), cookies -
+# podpisane ciasteczko bez żadnego odczytu z bazy (dane sesji widoczne dla
+# przeglądarki, wylogowanie nie unieważnia skopiowanego ciasteczka).
+# Wygasłe sesje z bazy usuwa `python manage.py purge_sessions`.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('SESSION_BACKEND', 'cached_db')]
+
+# widoki asynchroniczne (app.async_views) zamiast synchronicznych - włączane
+# domyślnie przez zapisani_sobie/asgi.py; pod WSGI nie dają korzyści
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == '1'
+
+# powiadomienia o nowych listach (app.notifications); broker w procesie widzi tylko
+# połączenia tego samego procesu - przy kilku workerach ASGI trzeba go podmienić
+NOTIFICATION_BROKER = 'app.notifications.InProcessBroker'
+
+# limit prób logowania, rejestracji i resetu hasła (app.ratelimit): kubełki
+# w pamięci procesu; przy kilku procesach 'app.ratelimit.CacheStore' ze wspólnym cache
+RATELIMIT_STORE = 'app.ratelimit.MemoryStore'
+RATELIMIT_RATES = {
+    # (pojemność kubełka, żetony na minutę)
+    'ip': (20, 10),
+    'email': (5, 2),
+}
+# adresy (lub sieci) reverse proxy, którym wolno podać adres klienta w X-Forwarded-For;
+# bez tego wszyscy za proxy dzieliliby jeden kubełek 'ip'
+RATELIMIT_TRUSTED_PROXIES = [proxy.strip() for proxy in
+                             os.getenv('RATELIMIT_TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if proxy.strip()]
+
+# kolejka zadań (app.tasks): wątek w procesie aplikacji; przy osobnym workerze
+# (`manage.py process_tasks --loop`) można ustawić False
+TASK_QUEUE_IN_PROCESS = True
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_USE_TLS = True